@@ -18,8 +18,11 @@ to the LLM, enabling accurate field path mapping.
 import os
 import io
 import json
+import hashlib
 import logging
 import asyncio
+import threading
+from collections import OrderedDict
 from dataclasses import dataclass, field
 from typing import Optional, List, Dict, Any, Tuple
 from enum import Enum
@@ -796,6 +799,41 @@ def analyze_and_inject_with_llm(
     return result
 
 
+# ============== Analysis Cache ==============
+
+# LLM analyses keyed by document content, entity and schema context: analyzing and then
+# injecting the same upload pays for the model call once. Only successful results are kept.
+LLM_ANALYSIS_CACHE_SIZE = int(os.environ.get("RG_LLM_ANALYSIS_CACHE_SIZE", "64"))
+_analysis_cache: "OrderedDict[Tuple[bytes, str, str], LLMAnalysisResult]" = OrderedDict()
+_analysis_cache_lock = threading.Lock()
+
+
+def _analysis_cache_key(
+    doc_bytes: bytes,
+    entity_def: str,
+    schema_fields: Optional[List[Dict[str, str]]],
+) -> Tuple[bytes, str, str]:
+    schema_key = json.dumps(schema_fields, sort_keys=True) if schema_fields else ""
+    return (hashlib.blake2b(doc_bytes, digest_size=16).digest(), entity_def or "", schema_key)
+
+
+def _analysis_cache_get(key: Tuple[bytes, str, str]) -> Optional[LLMAnalysisResult]:
+    with _analysis_cache_lock:
+        result = _analysis_cache.get(key)
+        if result is not None:
+            _analysis_cache.move_to_end(key)
+        return result
+
+
+def _analysis_cache_put(key: Tuple[bytes, str, str], result: LLMAnalysisResult) -> None:
+    if not result.success or LLM_ANALYSIS_CACHE_SIZE <= 0:
+        return
+    with _analysis_cache_lock:
+        _analysis_cache[key] = result
+        while len(_analysis_cache) > LLM_ANALYSIS_CACHE_SIZE:
+            _analysis_cache.popitem(last=False)
+
+
 # ============== Async Version for API Use ==============
 
 async def analyze_document_with_llm_async(
@@ -806,6 +844,12 @@ async def analyze_document_with_llm_async(
     """Async version of analyze_document_with_llm for use in FastAPI endpoints."""
     from anthropic import AsyncAnthropic
     
+    cache_key = _analysis_cache_key(doc_bytes, entity_def, schema_fields)
+    cached = _analysis_cache_get(cache_key)
+    if cached is not None:
+        log.debug("Reusing cached LLM analysis")
+        return cached
+    
     try:
         content = extract_document_content(doc_bytes)
         
@@ -885,7 +929,7 @@ async def analyze_document_with_llm_async(
             ip.token = _generate_token(ip)
             injection_points.append(ip)
         
-        return LLMAnalysisResult(
+        result = LLMAnalysisResult(
             success=True,
             injection_points=injection_points,
             document_summary=analysis.get("document_summary", ""),
@@ -893,6 +937,8 @@ async def analyze_document_with_llm_async(
             warnings=analysis.get("warnings", []),
             suggestions=analysis.get("suggestions", []),
         )
+        _analysis_cache_put(cache_key, result)
+        return result
         
     except Exception as e:
         log.error(f"Async LLM analysis failed: {e}", exc_info=True)
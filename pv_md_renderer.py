@@ -5,8 +5,11 @@ Templates are Markdown with Jinja2 syntax, converted to DOCX.
 
 import os
 import re
+import time
 import uuid
 import tempfile
+import threading
+from collections import OrderedDict
 from pathlib import Path
 from typing import Dict, Any, Optional, List, Tuple
 from datetime import datetime
@@ -24,8 +27,48 @@ TEMPLATES_DIR = Path(__file__).parent / "pv_templates"
 REPORTS_DIR = Path(__file__).parent / "reports"
 REPORTS_DIR.mkdir(exist_ok=True)
 
+class PreviewCache(OrderedDict):
+    """
+    Size- and age-bounded preview store.
+    
+    Previews are normally removed on finalize, but abandoned ones would otherwise live for
+    the whole server process. Entries expire after `ttl` seconds and the oldest are evicted
+    past `maxsize`. Used with plain `[key]` / `in` / `del` syntax.
+    """
+
+    def __init__(self, maxsize: int = 256, ttl: float = 3600.0):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._expires: Dict[str, float] = {}
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        while self and (len(self) > self.maxsize or self._expires[next(iter(self))] < now):
+            key, _ = self.popitem(last=False)
+            self._expires.pop(key, None)
+
+    def __setitem__(self, key, value) -> None:
+        with self._lock:
+            super().__setitem__(key, value)
+            self.move_to_end(key)
+            self._expires[key] = time.monotonic() + self.ttl
+            self._purge()
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            self._purge()
+            return super().__contains__(key)
+
+    def __delitem__(self, key) -> None:
+        with self._lock:
+            super().__delitem__(key)
+            self._expires.pop(key, None)
+
+
 # In-memory preview cache for agent workflow
-_preview_cache: Dict[str, Dict[str, Any]] = {}
+_preview_cache: Dict[str, Dict[str, Any]] = PreviewCache()
 
 
 def list_md_templates() -> Dict[str, Any]:
@@ -14,7 +14,7 @@ from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 from dataclasses import dataclass, asdict
 
-from pv_md_renderer import render_md_template, md_to_docx, REPORTS_DIR
+from pv_md_renderer import render_md_template, md_to_docx, REPORTS_DIR, PreviewCache
 
 log = logging.getLogger("pv_template_generator")
 
@@ -23,7 +23,7 @@ TEMPLATES_DIR = Path(__file__).parent / "pv_templates" / "saved"
 TEMPLATES_DIR.mkdir(parents=True, exist_ok=True)
 
 # In-memory preview cache
-_preview_cache: Dict[str, Dict[str, Any]] = {}
+_preview_cache: Dict[str, Dict[str, Any]] = PreviewCache()
 
 
 @dataclass
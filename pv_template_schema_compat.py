@@ -67,7 +67,7 @@ FieldMapping = FieldDef  # Old name
 HeaderSection = HeaderConfig
 DetailSection = DetailConfig
 TableSection = TableConfig
-TextSection = TextSection if 'TextSection' in dir() else TextConfig
+TextSection = TextConfig
 ColumnDef = TableColumn
 PageLayout = LayoutConfig
 
@@ -2,11 +2,12 @@ import os
 import json
 import asyncio
 import time
+import uuid
 from pathlib import Path
 from typing import Any, Dict, Callable, Optional, Tuple
 
 from fastapi import FastAPI, HTTPException
-from fastapi.responses import StreamingResponse, FileResponse
+from fastapi.responses import StreamingResponse, FileResponse, Response
 from fastapi.staticfiles import StaticFiles
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
@@ -20,7 +21,16 @@ REPORTS_DIR.mkdir(exist_ok=True)
 load_dotenv()
 
 # Use LangGraph agent (Claude via Anthropic SDK)
-from report_genius.agent import chat as langgraph_chat, get_agent, reset_session
+from report_genius.agent import (
+    chat as langgraph_chat,
+    chat_stream as langgraph_chat_stream,
+    get_pending_tools,
+    resume_tools,
+    get_agent,
+    reset_session,
+    saved_template_path,
+    template_document,
+)
 import logging
 
 # Template builder API router
@@ -32,6 +42,11 @@ class ChatRequest(BaseModel):
     session_id: str | None = None
 
 
+class ChatConfirmRequest(BaseModel):
+    session_id: str | None = None
+    approved: bool = True
+
+
 app = FastAPI(title="Kahua Agent API")
 app.add_middleware(
     CORSMiddleware,
@@ -145,15 +160,14 @@ async def get_pv_template(template_id: str) -> Dict[str, Any]:
     if ".." in template_id or "/" in template_id or "\\" in template_id:
         raise HTTPException(status_code=400, detail="Invalid template ID")
     
-    # Try with and without .json extension
-    file_path = PV_TEMPLATES_DIR / f"{template_id}.json"
+    # Try with and without .json extension (waiting for a tool's queued save first)
+    file_path = await asyncio.to_thread(saved_template_path, template_id)
     if not file_path.exists():
         file_path = PV_TEMPLATES_DIR / template_id
         if not file_path.exists():
             raise HTTPException(status_code=404, detail="Template not found")
     
-    with open(file_path, 'r') as f:
-        return json.load(f)
+    return template_document(file_path)
 
 
 @app.get("/api/pv-templates/{template_id}/download")
@@ -163,14 +177,14 @@ async def download_pv_template(template_id: str):
     if ".." in template_id or "/" in template_id or "\\" in template_id:
         raise HTTPException(status_code=400, detail="Invalid template ID")
     
-    file_path = PV_TEMPLATES_DIR / f"{template_id}.json"
+    file_path = await asyncio.to_thread(saved_template_path, template_id)
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Template not found")
     
-    return FileResponse(
-        path=file_path,
+    # Serve the public document shape, not the tools' compact on-disk format
+    return Response(
+        content=json.dumps(template_document(file_path), indent=2, ensure_ascii=False),
         media_type="application/json",
-        filename=f"{template_id}.json",
         headers={"Content-Disposition": f"attachment; filename=\"{template_id}.json\""}
     )
 
@@ -190,7 +204,7 @@ async def render_pv_template(template_id: str, req: RenderPVTemplateRequest) ->
     if ".." in template_id or "/" in template_id or "\\" in template_id:
         raise HTTPException(status_code=400, detail="Invalid template ID")
     
-    file_path = PV_TEMPLATES_DIR / f"{template_id}.json"
+    file_path = await asyncio.to_thread(saved_template_path, template_id)
     if not file_path.exists():
         raise HTTPException(status_code=404, detail="Template not found")
     
@@ -228,14 +242,17 @@ async def render_pv_template(template_id: str, req: RenderPVTemplateRequest) ->
 async def list_reports() -> Dict[str, Any]:
     """List all available reports."""
     reports = []
-    # Support both .docx and .pdf
-    for ext in ["*.docx", "*.pdf"]:
-        for f in REPORTS_DIR.glob(ext):
+    # Support both .docx and .pdf; one directory pass and one stat per file
+    with os.scandir(REPORTS_DIR) as entries:
+        for entry in entries:
+            if not entry.name.endswith((".docx", ".pdf")) or not entry.is_file():
+                continue
+            st = entry.stat()
             reports.append({
-                "filename": f.name,
-                "url": f"/reports/{f.name}",
-                "size_bytes": f.stat().st_size,
-                "created": f.stat().st_ctime,
+                "filename": entry.name,
+                "url": f"/reports/{entry.name}",
+                "size_bytes": st.st_size,
+                "created": st.st_ctime,
             })
     # Sort by creation time, newest first
     reports.sort(key=lambda r: r["created"], reverse=True)
@@ -319,19 +336,25 @@ async def get_uploaded_file(filename: str):
     return FileResponse(path=file_path, media_type=media_types.get(suffix, "application/octet-stream"))
 
 
+_IMAGE_SUFFIXES = frozenset({".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"})
+
+
 @app.get("/uploads")
 async def list_uploads() -> Dict[str, Any]:
     """List all uploaded files."""
     files = []
-    for f in UPLOADS_DIR.iterdir():
-        if f.is_file():
-            suffix = f.suffix.lower()
-            file_type = "image" if suffix in [".jpg", ".jpeg", ".png", ".gif", ".bmp", ".webp"] else "document"
+    # scandir reports the file type without a stat; hidden entries are tool sidecars/temp files
+    with os.scandir(UPLOADS_DIR) as entries:
+        for entry in entries:
+            if entry.name.startswith(".") or not entry.is_file():
+                continue
+            suffix = os.path.splitext(entry.name)[1].lower()
+            file_type = "image" if suffix in _IMAGE_SUFFIXES else "document"
             files.append({
-                "filename": f.name,
+                "filename": entry.name,
                 "type": file_type,
-                "size_bytes": f.stat().st_size,
-                "url": f"/uploads/{f.name}"
+                "size_bytes": entry.stat().st_size,
+                "url": f"/uploads/{entry.name}"
             })
     return {"files": files, "count": len(files)}
 
@@ -485,16 +508,14 @@ async def inject_tokens_into_template(
                        Format: [{"label": "ID", "path": "Number", "format": "text"}, ...]
     """
     try:
-        import json as json_module
-        
         content = await file.read()
         
         # Parse custom mappings if provided
         custom_mappings = None
         if field_mappings:
             try:
-                custom_mappings = json_module.loads(field_mappings)
-            except json_module.JSONDecodeError:
+                custom_mappings = json.loads(field_mappings)
+            except json.JSONDecodeError:
                 return {"status": "error", "error": "Invalid field_mappings JSON"}
         
         if not allow_low_confidence:
@@ -554,7 +575,7 @@ async def inject_tokens_into_template(
 # ============== Agentic Template Completion API ==============
 
 from agentic_template_analyzer import analyze_and_convert, analyze_document
-from report_genius.templates import PortableViewTemplate as TGTemplate
+from report_genius.templates import PortableViewTemplate as TGTemplate, PageHeaderFooterConfig
 from report_genius.rendering import DocxRenderer as SOTADocxRenderer
 
 
@@ -640,16 +661,15 @@ async def render_template_endpoint(
         Download URL for the rendered document
     """
     try:
-        json_path = PV_TEMPLATES_DIR / f"{template_id}.json"
+        json_path = await asyncio.to_thread(saved_template_path, template_id)
         
         if not json_path.exists():
             raise HTTPException(status_code=404, detail=f"Template {template_id} not found")
         
-        template = TGTemplate.model_validate_json(json_path.read_text())
+        template = TGTemplate.model_validate_json(json_path.read_bytes())
         
         # Ensure page footer with page numbers
         if not template.layout.page_footer:
-            from report_genius.templates import PageHeaderFooterConfig
             template.layout.page_footer = PageHeaderFooterConfig(
                 include_page_number=True,
                 page_number_format="Page {page} of {total}",
@@ -952,9 +972,28 @@ async def chat(req: ChatRequest) -> Dict[str, Any]:
         "final_output": response,
     }
 
+@app.get("/api/chat/pending")
+async def chat_pending(session_id: str = "web") -> Dict[str, Any]:
+    """List tool calls awaiting confirmation (see RG_CONFIRM_TOOLS)."""
+    calls = await get_pending_tools(session_id)
+    return {"session_id": session_id, "pending": [{"name": c["name"], "args": c["args"]} for c in calls]}
+
+
+@app.post("/api/chat/confirm")
+async def chat_confirm(req: ChatConfirmRequest) -> Dict[str, Any]:
+    """Approve or decline the pending tool calls and resume the session."""
+    session_id = (req.session_id or "web").strip()
+    try:
+        response = await resume_tools(session_id, approved=req.approved)
+    except Exception as e:
+        logging.getLogger("uvicorn.error").exception("Chat confirm error")
+        raise HTTPException(status_code=500, detail=str(e))
+    return {"final_output": response}
+
+
 @app.post("/api/chat/stream")
 async def chat_stream(req: ChatRequest):
-    """Streaming endpoint - falls back to non-streaming for now with LangGraph."""
+    """Streaming endpoint - emits agent tokens as they are generated."""
     if not req.message or not req.message.strip():
         raise HTTPException(status_code=400, detail="message is required")
 
@@ -963,11 +1002,8 @@ async def chat_stream(req: ChatRequest):
     async def event_stream():
         yield f"data: {json.dumps({'type': 'start', 'session_id': session_id})}\n\n"
         try:
-            # LangGraph doesn't have built-in streaming yet, so get full response
-            response = await langgraph_chat(req.message.strip(), session_id=session_id)
-            
-            # Emit as a single delta for now
-            yield f"data: {json.dumps({'type': 'delta', 'content': response})}\n\n"
+            async for delta in langgraph_chat_stream(req.message.strip(), session_id=session_id):
+                yield f"data: {json.dumps({'type': 'delta', 'content': delta})}\n\n"
             yield "data: {\"type\": \"done\"}\n\n"
         except Exception as e:
             yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
@@ -1058,13 +1094,13 @@ async def render_unified_template(template_id: str) -> Dict[str, Any]:
         raise HTTPException(status_code=400, detail="Invalid template ID")
     
     # Find template
-    json_path = PV_TEMPLATES_DIR / f"{template_id}.json"
+    json_path = await asyncio.to_thread(saved_template_path, template_id)
     
     if not json_path.exists():
         raise HTTPException(status_code=404, detail="Template not found")
     
     # Load and render
-    template = PortableViewTemplate.model_validate_json(json_path.read_text())
+    template = PortableViewTemplate.model_validate_json(json_path.read_bytes())
     system = get_unified_system()
     
     docx_path = REPORTS_DIR / f"{template_id}.docx"
@@ -1083,7 +1119,6 @@ _agent_sessions: Dict[str, Any] = {}
 @app.post("/api/unified/agent/session")
 async def create_agent_session() -> Dict[str, Any]:
     """Create a new agent session for conversational template creation."""
-    import uuid
     session_id = f"agent-{uuid.uuid4().hex[:8]}"
     
     system = get_unified_system()
@@ -27,8 +27,12 @@ try:
         reset_session,
         chat_sync,
         chat,
+        chat_many,
+        chat_stream,
+        get_pending_tools,
+        resume_tools,
     )
-    from .tools import ENTITY_ALIASES, resolve_entity_def, get_all_tools
+    from .tools import ENTITY_ALIASES, resolve_entity_def, get_all_tools, saved_template_path, template_document
     from .prompts import SYSTEM_PROMPT
     
     AGENT_AVAILABLE = True
@@ -48,8 +52,14 @@ except ImportError:
         
         AGENT_AVAILABLE = True
         get_all_tools = None
+        saved_template_path = None
+        template_document = None
         SYSTEM_PROMPT = None
         chat = None
+        chat_many = None
+        chat_stream = None
+        get_pending_tools = None
+        resume_tools = None
         
     except ImportError as e:
         import warnings
@@ -62,9 +72,15 @@ except ImportError:
         reset_session = None
         chat_sync = None
         chat = None
+        chat_many = None
+        chat_stream = None
+        get_pending_tools = None
+        resume_tools = None
         ENTITY_ALIASES = {}
         resolve_entity_def = None
         get_all_tools = None
+        saved_template_path = None
+        template_document = None
         SYSTEM_PROMPT = None
 
 
@@ -83,9 +99,17 @@ __all__ = [
     # Chat interface
     "chat_sync",
     "chat",
+    "chat_many",
+    "chat_stream",
+    
+    # Tool confirmation
+    "get_pending_tools",
+    "resume_tools",
     
     # Tools
     "get_all_tools",
+    "saved_template_path",
+    "template_document",
     "SYSTEM_PROMPT",
     
     # Configuration
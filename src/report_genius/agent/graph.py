@@ -5,23 +5,40 @@ Core agent implementation using LangGraph with Claude via Azure.
 """
 
 import os
+import asyncio
+import functools
+import importlib.util
 import logging
-from typing import Dict, Annotated, TypedDict
+import re
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple, Annotated, TypedDict
 
 from dotenv import load_dotenv
-from langchain_anthropic import ChatAnthropic
-from langchain_core.messages import HumanMessage, AIMessage, SystemMessage
+from langchain_core.globals import set_llm_cache
+from langchain_core.messages import HumanMessage, AIMessage, SystemMessage, ToolMessage
+from langchain_core.runnables import RunnableLambda
 from langgraph.graph import StateGraph, START, END
 from langgraph.graph.message import add_messages
 from langgraph.prebuilt import ToolNode
 from langgraph.checkpoint.memory import MemorySaver
 
+from report_genius.config import DATA_DIR
+
 from .prompts import SYSTEM_PROMPT, TEMPLATE_BUILDER_PROMPT, ANALYTICS_PROMPT, INJECTION_PROMPT
 from .tools import get_all_tools, get_tools_by_mode, ENTITY_ALIASES
 
 # Load environment before imports that need it
 load_dotenv()
 
+# langchain_anthropic (and the anthropic SDK behind it) dominates import time, so it is only
+# imported when an LLM is created; still fail here so the package falls back when it's missing
+if importlib.util.find_spec("langchain_anthropic") is None:
+    raise ImportError("langchain_anthropic is required for the agent")
+
 log = logging.getLogger(__name__)
 
 # ============== Configuration ==============
@@ -35,6 +52,75 @@ MAX_MESSAGES = 30
 SUMMARY_TRIGGER_MESSAGES = int(os.getenv("RG_SUMMARY_TRIGGER_MESSAGES", "24"))
 SUMMARY_KEEP_MESSAGES = int(os.getenv("RG_SUMMARY_KEEP_MESSAGES", "12"))
 
+# Once the outgoing history exceeds this many characters (~4 chars per token), tool results
+# older than the most recent TOOL_RESULT_KEEP are replaced by a short placeholder
+TOOL_RESULT_TRIM_CHARS = int(os.getenv("RG_TOOL_RESULT_TRIM_CHARS", "200000"))
+TOOL_RESULT_KEEP = int(os.getenv("RG_TOOL_RESULT_KEEP", "5"))
+
+# Checkpoint storage for conversation state
+CHECKPOINT_DB = os.getenv("RG_CHECKPOINT_DB", str(DATA_DIR / "checkpoints.db"))
+# Checkpoints kept per conversation thread; older ones are pruned at startup (0 keeps all)
+CHECKPOINT_KEEP = int(os.getenv("RG_CHECKPOINT_KEEP", "20"))
+
+# LLM response cache (identical prompts skip the Claude round-trip)
+LLM_CACHE_ENABLED = os.getenv("RG_ENABLE_LLM_CACHE", "1").strip().lower() in {"1", "true", "yes"}
+LLM_CACHE_PATH = os.getenv("RG_LLM_CACHE_PATH", str(DATA_DIR / "llm_cache.db"))
+
+# Expensive tools that pause the graph for user approval (comma-separated, e.g.
+# "generate_report,render_smart_template"). Empty disables confirmation.
+CONFIRM_TOOLS = frozenset(
+    name.strip() for name in os.getenv("RG_CONFIRM_TOOLS", "").split(",") if name.strip()
+)
+
+# Conversation threads kept in the checkpointer: least recently used sessions beyond
+# RG_MAX_SESSIONS are deleted, as are sessions idle longer than RG_SESSION_IDLE_TIMEOUT
+# seconds (0 keeps idle sessions; checkpoints are meant to survive restarts)
+MAX_SESSIONS = int(os.getenv("RG_MAX_SESSIONS", "1024"))
+SESSION_IDLE_TIMEOUT = float(os.getenv("RG_SESSION_IDLE_TIMEOUT", "0"))
+
+# Build the agent on a background thread at import so the first request doesn't pay for it
+AGENT_EAGER_INIT = os.getenv("RG_AGENT_EAGER_INIT", "").strip().lower() in {"1", "true", "yes"}
+
+# Max LLM calls in flight at once across concurrent async chats
+AGENT_MAX_CONCURRENCY = int(os.getenv("RG_AGENT_MAX_CONCURRENCY", "8"))
+
+_llm_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_llm_semaphore() -> asyncio.Semaphore:
+    """Get the LLM-call limiting semaphore for the running event loop."""
+    loop = asyncio.get_running_loop()
+    sem = _llm_semaphores.get(loop)
+    if sem is None:
+        sem = _llm_semaphores[loop] = asyncio.Semaphore(AGENT_MAX_CONCURRENCY)
+    return sem
+
+
+# ============== LLM Cache ==============
+
+def _enable_llm_cache() -> None:
+    """
+    Enable the LangChain LLM cache.
+    
+    Persists to SQLite via langchain-community (a declared dependency); if it is not
+    installed, falls back to a per-process in-memory cache that is lost on restart.
+    """
+    try:
+        from langchain_community.cache import SQLiteCache
+    except ImportError:
+        from langchain_core.caches import InMemoryCache
+        set_llm_cache(InMemoryCache(maxsize=1024))
+        log.warning("langchain-community not installed, LLM cache is in-memory only")
+        return
+    set_llm_cache(SQLiteCache(database_path=LLM_CACHE_PATH))
+    log.info(f"LLM cache enabled (sqlite: {LLM_CACHE_PATH})")
+
+
+if LLM_CACHE_ENABLED:
+    _enable_llm_cache()
+
 
 # ============== Agent State ==============
 
@@ -47,8 +133,10 @@ class AgentState(TypedDict):
 
 # ============== LLM Setup ==============
 
+@functools.lru_cache(maxsize=1)
 def create_llm():
-    """Create Claude LLM configured for Azure."""
+    """Create Claude LLM configured for Azure (one shared instance and connection pool)."""
+    from langchain_anthropic import ChatAnthropic
     base_url = f"{AZURE_ENDPOINT}/anthropic"
     
     return ChatAnthropic(
@@ -56,11 +144,14 @@ def create_llm():
         api_key=AZURE_KEY,
         base_url=base_url,
         max_tokens=8192,
+        streaming=True,
     )
 
 
+@functools.lru_cache(maxsize=1)
 def _create_summary_llm():
-    """Create a smaller LLM instance for summarization."""
+    """Create a smaller LLM instance for summarization, reused across summaries."""
+    from langchain_anthropic import ChatAnthropic
     base_url = f"{AZURE_ENDPOINT}/anthropic"
     return ChatAnthropic(
         model=MODEL_DEPLOYMENT,
@@ -70,27 +161,128 @@ def _create_summary_llm():
     )
 
 
+@functools.lru_cache(maxsize=None)
+def _tool_bound_llm(mode: str):
+    """The shared LLM with a mode's tools bound; tool schemas are converted once per mode."""
+    return create_llm().bind_tools(get_tools_by_mode(mode))
+
+
+# ============== Checkpointer ==============
+
+def _create_checkpointer():
+    """
+    Create the SQLite checkpointer for conversation state.
+
+    SqliteSaver only implements the sync interface, so the async methods used by
+    `agent.ainvoke` are run on a worker thread. One saver then serves both
+    `chat` and `chat_sync`. Falls back to MemorySaver if
+    langgraph-checkpoint-sqlite is not installed.
+    """
+    try:
+        from langgraph.checkpoint.sqlite import SqliteSaver
+    except ImportError:
+        log.warning("langgraph-checkpoint-sqlite not installed, using in-memory checkpoints")
+        return MemorySaver()
+
+    class ThreadedSqliteSaver(SqliteSaver):
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+
+        async def alist(self, config, *, filter=None, before=None, limit=None):
+            items = await asyncio.to_thread(
+                lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+            )
+            for item in items:
+                yield item
+
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+        async def aput_writes(self, config, writes, task_id, task_path=""):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+        async def adelete_thread(self, thread_id):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+
+    conn = sqlite3.connect(CHECKPOINT_DB, check_same_thread=False)
+    saver = ThreadedSqliteSaver(conn)
+    saver.setup()
+    if CHECKPOINT_KEEP > 0:
+        _prune_checkpoints(conn, CHECKPOINT_KEEP)
+    _seed_sessions(saver)
+    return saver
+
+
+def _prune_checkpoints(conn: sqlite3.Connection, keep: int) -> None:
+    """
+    Delete all but the newest `keep` checkpoints of each thread, plus their pending writes.
+    
+    Every graph step stores a full checkpoint, so the database otherwise grows with the
+    total number of turns ever taken. Resuming (including paused tool confirmations) only
+    needs the latest checkpoint and its writes; checkpoint ids sort by creation time.
+    """
+    with conn:
+        deleted = conn.execute(
+            """
+            DELETE FROM checkpoints WHERE rowid IN (
+                SELECT rowid FROM (
+                    SELECT rowid, ROW_NUMBER() OVER (
+                        PARTITION BY thread_id, checkpoint_ns ORDER BY checkpoint_id DESC
+                    ) AS rn
+                    FROM checkpoints
+                ) WHERE rn > ?
+            )
+            """,
+            (keep,),
+        ).rowcount
+        conn.execute(
+            """
+            DELETE FROM writes WHERE NOT EXISTS (
+                SELECT 1 FROM checkpoints c
+                WHERE c.thread_id = writes.thread_id
+                  AND c.checkpoint_ns = writes.checkpoint_ns
+                  AND c.checkpoint_id = writes.checkpoint_id
+            )
+            """
+        )
+    if deleted:
+        log.info(f"Pruned {deleted} old checkpoints (keeping {keep} per thread)")
+
+
 # ============== Graph Definition ==============
 
-def _classify_intent(text: str) -> str:
-    text_lower = (text or "").lower()
-    injection_keywords = [
+# System prompt per routed mode; the messages are built once and reused every turn
+MODE_PROMPTS: Dict[str, str] = {
+    "injection": INJECTION_PROMPT,
+    "template": TEMPLATE_BUILDER_PROMPT,
+    "analytics": ANALYTICS_PROMPT,
+    "general": SYSTEM_PROMPT,
+}
+_SYSTEM_MESSAGES: Dict[str, SystemMessage] = {
+    mode: SystemMessage(content=prompt) for mode, prompt in MODE_PROMPTS.items()
+}
+
+
+# Routing keywords per mode, checked in order (first mode with a substring hit wins)
+_INTENT_KEYWORDS = (
+    ("injection", (
         "inject", "injection", "token", "tokens", "placeholder", "placeholders",
         "docx", "word doc", "word document", "uploaded template", "upload template",
-    ]
-    template_keywords = [
-        "template", "portable view", "pv",
-    ]
-    report_keywords = [
-        "report", "summary", "list", "show me", "count",
-    ]
-
-    if any(k in text_lower for k in injection_keywords):
-        return "injection"
-    if any(k in text_lower for k in template_keywords):
-        return "template"
-    if any(k in text_lower for k in report_keywords):
-        return "analytics"
+    )),
+    ("template", ("template", "portable view", "pv")),
+    ("analytics", ("report", "summary", "list", "show me", "count")),
+)
+# One compiled alternation per mode: a single scan of the message instead of one per keyword
+_INTENT_PATTERNS = tuple(
+    (mode, re.compile("|".join(map(re.escape, keywords)))) for mode, keywords in _INTENT_KEYWORDS
+)
+
+
+def _classify_intent(text: str) -> str:
+    text_lower = (text or "").lower()
+    for mode, pattern in _INTENT_PATTERNS:
+        if pattern.search(text_lower):
+            return mode
     return "general"
 
 
@@ -128,50 +320,79 @@ def _summarize_messages(messages: list, existing_summary: str = "") -> str:
     return response.content.strip()
 
 
-def create_agent():
+def _content_len(content) -> int:
+    if isinstance(content, str):
+        return len(content)
+    return sum(len(block.get("text", "")) if isinstance(block, dict) else len(str(block)) for block in content)
+
+
+def _clear_old_tool_results(messages: list) -> list:
+    """
+    Replace the bodies of old tool results once the history gets large.
+    
+    A single schema dump or entity listing can be tens of KB, so a message-count cap alone
+    does not bound the prompt. The ToolMessages (and their tool_call_ids) stay in place so
+    tool_use/tool_result pairing is preserved; only copies are sent, the stored history is
+    left untouched.
+    """
+    if sum(_content_len(m.content) for m in messages) <= TOOL_RESULT_TRIM_CHARS:
+        return messages
+    tool_indexes = [i for i, m in enumerate(messages) if isinstance(m, ToolMessage)]
+    old = tool_indexes[:-TOOL_RESULT_KEEP] if TOOL_RESULT_KEEP > 0 else tool_indexes
+    if not old:
+        return messages
+    messages = list(messages)
+    for i in old:
+        msg = messages[i]
+        messages[i] = msg.model_copy(update={
+            "content": f"[cleared: {_content_len(msg.content)} chars]",
+            "additional_kwargs": {**msg.additional_kwargs, "cleared": True},
+        })
+    log.info(f"Cleared {len(old)} old tool results from the prompt")
+    return messages
+
+
+def create_agent(checkpointer=None):
     """Create the LangGraph agent."""
     
     # Get all tools for execution
     all_tools = get_all_tools()
     
-    # Create LLM (bind tools per mode inside agent_node)
-    llm = create_llm()
-    
     # Agent node - calls LLM
-    def agent_node(state: AgentState):
+    def _prepare_messages(state: AgentState):
+        """Bound LLM for the routed mode and the message list to send it."""
         messages = state["messages"]
         mode = state.get("mode", "general")
+        if mode not in MODE_PROMPTS:
+            mode = "general"
         summary = state.get("summary", "")
 
-        if mode == "injection":
-            system_prompt = INJECTION_PROMPT
-        elif mode == "template":
-            system_prompt = TEMPLATE_BUILDER_PROMPT
-        elif mode == "analytics":
-            system_prompt = ANALYTICS_PROMPT
-        else:
-            system_prompt = SYSTEM_PROMPT
         if summary:
-            system_prompt = f"{system_prompt}\n\nConversation summary:\n{summary}"
-        
-        # Ensure system message is first
-        if not messages or not isinstance(messages[0], SystemMessage):
-            messages = [SystemMessage(content=system_prompt)] + messages
-        elif messages[0].content != system_prompt:
-            messages = [SystemMessage(content=system_prompt)] + messages[1:]
+            system_msg = SystemMessage(
+                content=f"{MODE_PROMPTS[mode]}\n\nConversation summary:\n{summary}"
+            )
+        else:
+            system_msg = _SYSTEM_MESSAGES[mode]
         
-        # Truncate message history if too long (keep system + recent messages)
-        if len(messages) > MAX_MESSAGES:
-            system_msg = messages[0] if isinstance(messages[0], SystemMessage) else None
-            recent_messages = messages[-(MAX_MESSAGES - 1):] if system_msg else messages[-MAX_MESSAGES:]
-            if system_msg:
-                messages = [system_msg] + recent_messages
-            else:
-                messages = recent_messages
-            log.info(f"Truncated message history to {len(messages)} messages")
+        # Ensure system message is first; slice the history once so only the kept
+        # messages are copied (keep system + recent messages)
+        start = 1 if messages and isinstance(messages[0], SystemMessage) else 0
+        if len(messages) - start >= MAX_MESSAGES:
+            start = len(messages) - (MAX_MESSAGES - 1)
+            log.info(f"Truncated message history to {MAX_MESSAGES} messages")
+        messages = _clear_old_tool_results([system_msg, *messages[start:]])
         
-        llm_with_tools = llm.bind_tools(get_tools_by_mode(mode))
-        response = llm_with_tools.invoke(messages)
+        return _tool_bound_llm(mode), messages
+    
+    def agent_node(state: AgentState):
+        llm_with_tools, messages = _prepare_messages(state)
+        return {"messages": [llm_with_tools.invoke(messages)]}
+    
+    async def aagent_node(state: AgentState):
+        # Native async call, so concurrent chats overlap their LLM round-trips
+        llm_with_tools, messages = _prepare_messages(state)
+        async with _get_llm_semaphore():
+            response = await llm_with_tools.ainvoke(messages)
         return {"messages": [response]}
     
     # Tool node - executes tools
@@ -179,10 +400,12 @@ def create_agent():
     
     # Router - decide next step
     def should_continue(state: AgentState):
-        last_message = state["messages"][-1]
-        if hasattr(last_message, "tool_calls") and last_message.tool_calls:
-            return "tools"
-        return END
+        tool_calls = getattr(state["messages"][-1], "tool_calls", None)
+        if not tool_calls:
+            return END
+        if CONFIRM_TOOLS and any(call["name"] in CONFIRM_TOOLS for call in tool_calls):
+            return "confirm_tools"
+        return "tools"
     
     def route_node(state: AgentState):
         messages = state["messages"]
@@ -210,32 +433,157 @@ def create_agent():
     graph = StateGraph(AgentState)
     graph.add_node("router", route_node)
     graph.add_node("summarize", summarize_node)
-    graph.add_node("agent", agent_node)
+    graph.add_node("agent", RunnableLambda(agent_node, afunc=aagent_node, name="agent"))
     graph.add_node("tools", tool_node)
+    graph.add_node("confirm_tools", ToolNode(all_tools))
     
     graph.add_edge(START, "router")
     graph.add_edge("router", "summarize")
     graph.add_edge("summarize", "agent")
-    graph.add_conditional_edges("agent", should_continue, {"tools": "tools", END: END})
+    graph.add_conditional_edges(
+        "agent", should_continue,
+        {"tools": "tools", "confirm_tools": "confirm_tools", END: END},
+    )
     graph.add_edge("tools", "agent")
+    graph.add_edge("confirm_tools", "agent")
     
-    # Compile with memory
-    memory = MemorySaver()
-    return graph.compile(checkpointer=memory)
+    # Compile with persistent checkpoints; the graph pauses before confirm_tools
+    # until resume_tools() is called for the session
+    if checkpointer is None:
+        checkpointer = _create_checkpointer()
+    return graph.compile(
+        checkpointer=checkpointer,
+        interrupt_before=["confirm_tools"] if CONFIRM_TOOLS else None,
+    )
 
 
 # ============== Main Interface ==============
 
 _agent = None
+_agent_lock = threading.Lock()
 
 
 def get_agent():
     """Get or create the agent singleton."""
     global _agent
+    agent = _agent
+    if agent is not None:
+        return agent
+    # Only construction takes the lock, so the warm-up thread and a first request can't
+    # both build an agent (and a second checkpoint connection)
+    with _agent_lock:
+        if _agent is None:
+            log.info(f"Creating LangGraph agent with model: {MODEL_DEPLOYMENT}")
+            _agent = create_agent()
+        return _agent
+
+
+def _warm_up_agent() -> None:
+    try:
+        get_agent()
+    except Exception as exc:
+        # The first request will retry and surface the error
+        log.warning(f"Agent warm-up failed: {exc}")
+
+
+async def close_agent() -> None:
+    """Close the agent's checkpoint connection (call on server shutdown)."""
+    global _agent
     if _agent is None:
-        log.info(f"Creating LangGraph agent with model: {MODEL_DEPLOYMENT}")
-        _agent = create_agent()
-    return _agent
+        return
+    conn = getattr(_agent.checkpointer, "conn", None)
+    if conn is not None:
+        result = conn.close()
+        if asyncio.iscoroutine(result):
+            await result
+    _agent = None
+
+
+# session_id -> last use (monotonic), oldest first
+_session_last_used: "OrderedDict[str, float]" = OrderedDict()
+_session_lock = threading.Lock()
+
+
+def _evict_sessions_locked(now: float) -> List[str]:
+    """Pop sessions past MAX_SESSIONS or the idle timeout; caller holds `_session_lock`."""
+    evicted = []
+    while len(_session_last_used) > MAX_SESSIONS:
+        evicted.append(_session_last_used.popitem(last=False)[0])
+    if SESSION_IDLE_TIMEOUT > 0:
+        cutoff = now - SESSION_IDLE_TIMEOUT
+        while _session_last_used and next(iter(_session_last_used.values())) < cutoff:
+            evicted.append(_session_last_used.popitem(last=False)[0])
+    return evicted
+
+
+def _seed_sessions(saver) -> None:
+    """
+    Index threads persisted by earlier runs so they count toward (and age out of) the
+    session limits, then evict any already past them.
+    
+    Last use is taken from each thread's newest checkpoint id (uuid6, time-ordered);
+    threads with other ids are treated as just used.
+    """
+    from langgraph.checkpoint.base.id import UUID as CheckpointUUID
+    
+    rows = saver.conn.execute(
+        "SELECT thread_id, MAX(checkpoint_id) FROM checkpoints GROUP BY thread_id"
+    ).fetchall()
+    if not rows:
+        return
+    now, wall = time.monotonic(), time.time()
+    seeded = []
+    for thread_id, checkpoint_id in rows:
+        try:
+            # uuid6 time is 100ns intervals since 1582-10-15
+            ts = (CheckpointUUID(checkpoint_id).time - 0x01B21DD213814000) / 1e7
+        except (TypeError, ValueError):
+            ts = wall
+        seeded.append((now - max(wall - ts, 0.0), thread_id))
+    seeded.sort()
+    with _session_lock:
+        for last_used, thread_id in seeded:
+            _session_last_used.setdefault(thread_id, last_used)
+        evicted = _evict_sessions_locked(now)
+    for sid in evicted:
+        saver.delete_thread(sid)
+    log.info(f"Indexed {len(seeded)} stored sessions, evicted {len(evicted)}")
+
+
+def _touch_session(session_id: str) -> List[str]:
+    """Record a session as used and return the ids evicted to stay within the limits."""
+    now = time.monotonic()
+    with _session_lock:
+        _session_last_used[session_id] = now
+        _session_last_used.move_to_end(session_id)
+        return _evict_sessions_locked(now)
+
+
+def _session_agent(session_id: str):
+    """
+    Get the agent for a chat turn, recording the session as used.
+    
+    Evicts the least recently used sessions past MAX_SESSIONS (and idle ones, if a
+    timeout is set) so checkpoint storage stays bounded on long-running servers.
+    """
+    agent = get_agent()
+    evicted = _touch_session(session_id)
+    if evicted:
+        for sid in evicted:
+            agent.checkpointer.delete_thread(sid)
+        log.info(f"Evicted {len(evicted)} sessions ({len(_session_last_used)} active)")
+    return agent
+
+
+async def _asession_agent(session_id: str):
+    """Async `_session_agent`: evicted threads are deleted without blocking the event loop."""
+    agent = get_agent()
+    evicted = _touch_session(session_id)
+    if evicted:
+        for sid in evicted:
+            await agent.checkpointer.adelete_thread(sid)
+        log.info(f"Evicted {len(evicted)} sessions ({len(_session_last_used)} active)")
+    return agent
 
 
 def reset_session(session_id: str = "default") -> bool:
@@ -245,12 +593,119 @@ def reset_session(session_id: str = "default") -> bool:
     
     Returns True if session was reset.
     """
-    global _agent
-    _agent = None
-    log.info(f"Session {session_id} reset - agent will be recreated")
+    # Sessions are checkpoint threads of the shared agent, so only the corrupted thread is
+    # dropped; the compiled graph, bound tools and checkpoint connection stay in place
+    get_agent().checkpointer.delete_thread(session_id)
+    log.info(f"Session {session_id} reset")
     return True
 
 
+# ============== Tool Confirmation ==============
+
+def _pending_tool_calls(state) -> List[dict]:
+    """Tool calls waiting on user approval for a paused thread."""
+    if "confirm_tools" not in state.next:
+        return []
+    return state.values["messages"][-1].tool_calls
+
+
+async def get_pending_tools(session_id: str = "default") -> List[dict]:
+    """Return the tool calls awaiting confirmation for a session (empty if none)."""
+    if not CONFIRM_TOOLS:
+        return []
+    config = {"configurable": {"thread_id": session_id}}
+    state = await get_agent().aget_state(config)
+    return _pending_tool_calls(state)
+
+
+def _decline_update(calls: List[dict]) -> dict:
+    return {"messages": [
+        ToolMessage(content="Declined by user.", tool_call_id=call["id"])
+        for call in calls
+    ]}
+
+
+async def _decline_pending(agent, config) -> List[dict]:
+    """Answer pending tool calls with a decline so the thread can continue."""
+    calls = _pending_tool_calls(await agent.aget_state(config))
+    if calls:
+        await agent.aupdate_state(config, _decline_update(calls), as_node="confirm_tools")
+    return calls
+
+
+def _decline_pending_sync(agent, config) -> List[dict]:
+    """Synchronous version of _decline_pending."""
+    calls = _pending_tool_calls(agent.get_state(config))
+    if calls:
+        agent.update_state(config, _decline_update(calls), as_node="confirm_tools")
+    return calls
+
+
+def _confirmation_notice(calls: List[dict]) -> Optional[str]:
+    if not calls:
+        return None
+    names = ", ".join(sorted({call["name"] for call in calls}))
+    return f"Awaiting confirmation before running: {names}."
+
+
+async def resume_tools(session_id: str = "default", approved: bool = True) -> str:
+    """
+    Resume a session paused before an expensive tool call.
+    
+    Args:
+        session_id: Session ID for conversation memory
+        approved: Run the pending tools if True, otherwise decline them
+    
+    Returns:
+        Agent response text
+    """
+    agent = await _asession_agent(session_id)
+    config = {"configurable": {"thread_id": session_id}}
+    
+    if approved:
+        if not _pending_tool_calls(await agent.aget_state(config)):
+            return "No tool calls awaiting confirmation."
+    elif not await _decline_pending(agent, config):
+        return "No tool calls awaiting confirmation."
+    
+    result = await agent.ainvoke(None, config=config)
+    notice = _confirmation_notice(_pending_tool_calls(await agent.aget_state(config)))
+    if notice:
+        return notice
+    return _last_ai_text(result)
+
+
+def _is_pending_tool_use_error(exc: Exception) -> bool:
+    """True for the provider's 400 on a thread left with unanswered tool calls."""
+    return (
+        getattr(exc, "status_code", None) == 400
+        and "tool_use ids were found without tool_result" in str(exc)
+    )
+
+
+def _reset_corrupted(session_id: str) -> None:
+    log.warning(f"Session {session_id} corrupted (pending tool calls), resetting...")
+    reset_session(session_id)
+
+
+async def _areset_corrupted(agent, session_id: str) -> None:
+    log.warning(f"Session {session_id} corrupted (pending tool calls), resetting...")
+    await agent.checkpointer.adelete_thread(session_id)
+    log.info(f"Session {session_id} reset")
+
+
+def _last_ai_text(result) -> str:
+    """Text of the final AI message in a graph result."""
+    messages = result["messages"]
+    # The graph only ends after the agent node, so this is almost always the last message
+    if messages and isinstance(messages[-1], AIMessage):
+        return messages[-1].content
+    for msg in reversed(messages):
+        if isinstance(msg, AIMessage):
+            return msg.content
+    return "No response generated."
+
+
 async def chat(message: str, session_id: str = "default") -> str:
     """
     Send a message to the agent and get a response.
@@ -262,75 +717,123 @@ async def chat(message: str, session_id: str = "default") -> str:
     Returns:
         Agent response text
     """
-    agent = get_agent()
+    agent = await _asession_agent(session_id)
     
     config = {"configurable": {"thread_id": session_id}}
     
+    # A new message implicitly declines tools still awaiting confirmation
+    if CONFIRM_TOOLS:
+        await _decline_pending(agent, config)
+    
+    payload = {"messages": [HumanMessage(content=message)]}
     try:
-        result = await agent.ainvoke(
-            {"messages": [HumanMessage(content=message)]},
-            config=config
-        )
-        
-        # Get the last AI message
-        for msg in reversed(result["messages"]):
-            if isinstance(msg, AIMessage):
-                return msg.content
-        
-        return "No response generated."
+        result = await agent.ainvoke(payload, config=config)
     except Exception as e:
-        error_str = str(e)
-        # Check for the specific tool_use/tool_result mismatch error
-        if "tool_use ids were found without tool_result" in error_str:
-            log.warning(f"Session {session_id} corrupted (pending tool calls), resetting...")
-            reset_session(session_id)
-            # Retry with fresh agent
-            agent = get_agent()
-            result = await agent.ainvoke(
-                {"messages": [HumanMessage(content=message)]},
-                config=config
-            )
-            for msg in reversed(result["messages"]):
-                if isinstance(msg, AIMessage):
-                    return msg.content
-            return "No response generated."
-        else:
+        if not _is_pending_tool_use_error(e):
             raise
+        await _areset_corrupted(agent, session_id)
+        # Retry on the now-empty thread
+        result = await agent.ainvoke(payload, config=config)
+    
+    if CONFIRM_TOOLS:
+        notice = _confirmation_notice(_pending_tool_calls(await agent.aget_state(config)))
+        if notice:
+            return notice
+    return _last_ai_text(result)
+
+
+async def chat_many(items: List[Tuple[str, str]]) -> List[str]:
+    """
+    Run several chats concurrently (e.g. one message per user session).
+    
+    LLM calls overlap up to RG_AGENT_MAX_CONCURRENCY at a time. Use distinct session IDs;
+    two messages for the same session would race on its conversation state.
+    
+    Args:
+        items: (message, session_id) pairs
+    
+    Returns:
+        Agent response text for each item, in order
+    """
+    return list(await asyncio.gather(*(chat(message, session_id) for message, session_id in items)))
+
+
+def _chunk_text(content) -> str:
+    """Extract text from a streamed message chunk (str or content blocks)."""
+    if isinstance(content, str):
+        return content
+    return "".join(
+        block.get("text", "") for block in content
+        if isinstance(block, dict) and block.get("type") == "text"
+    )
+
+
+async def chat_stream(message: str, session_id: str = "default") -> AsyncIterator[str]:
+    """
+    Send a message to the agent and stream the response text as it is generated.
+    
+    Args:
+        message: User message
+        session_id: Session ID for conversation memory
+    
+    Yields:
+        Text deltas from the agent's LLM calls
+    """
+    agent = await _asession_agent(session_id)
+    
+    config = {"configurable": {"thread_id": session_id}}
+    
+    if CONFIRM_TOOLS:
+        await _decline_pending(agent, config)
+    
+    async for event in agent.astream_events(
+        {"messages": [HumanMessage(content=message)]},
+        config=config,
+        version="v2",
+    ):
+        if event["event"] != "on_chat_model_stream":
+            continue
+        # Only stream the agent node (skip the summarizer LLM)
+        if event.get("metadata", {}).get("langgraph_node") != "agent":
+            continue
+        text = _chunk_text(event["data"]["chunk"].content)
+        if text:
+            yield text
+    
+    if CONFIRM_TOOLS:
+        notice = _confirmation_notice(_pending_tool_calls(await agent.aget_state(config)))
+        if notice:
+            yield f"\n\n{notice}"
 
 
 def chat_sync(message: str, session_id: str = "default") -> str:
     """Synchronous version of chat."""
-    agent = get_agent()
+    agent = _session_agent(session_id)
     
     config = {"configurable": {"thread_id": session_id}}
     
+    # A new message implicitly declines tools still awaiting confirmation
+    if CONFIRM_TOOLS:
+        _decline_pending_sync(agent, config)
+    
+    payload = {"messages": [HumanMessage(content=message)]}
     try:
-        result = agent.invoke(
-            {"messages": [HumanMessage(content=message)]},
-            config=config
-        )
-        
-        for msg in reversed(result["messages"]):
-            if isinstance(msg, AIMessage):
-                return msg.content
-        
-        return "No response generated."
+        result = agent.invoke(payload, config=config)
     except Exception as e:
-        error_str = str(e)
-        if "tool_use ids were found without tool_result" in error_str:
-            log.warning(f"Session {session_id} corrupted, resetting...")
-            reset_session(session_id)
-            agent = get_agent()
-            result = agent.invoke(
-                {"messages": [HumanMessage(content=message)]},
-                config=config
-            )
-            for msg in reversed(result["messages"]):
-                if isinstance(msg, AIMessage):
-                    return msg.content
-            return "No response generated."
-        else:
+        if not _is_pending_tool_use_error(e):
             raise
+        _reset_corrupted(session_id)
+        result = agent.invoke(payload, config=config)
+    
+    if CONFIRM_TOOLS:
+        notice = _confirmation_notice(_pending_tool_calls(agent.get_state(config)))
+        if notice:
+            return notice
+    return _last_ai_text(result)
+
+
+if AGENT_EAGER_INIT:
+    threading.Thread(target=_warm_up_agent, name="rg-agent-warmup", daemon=True).start()
 
 
 # ============== Test ==============
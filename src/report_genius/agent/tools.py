@@ -6,21 +6,71 @@ Organized by category: Kahua API, Templates (SOTA), Legacy Templates, DOCX Injec
 """
 
 import os
-import json
+import asyncio
+import functools
+import atexit
+import base64
+import hashlib
 import logging
-from typing import Any, Dict, List
+import re
+import importlib.util
+import sys
+import tempfile
+import threading
+import time
+import traceback
+import types
+import weakref
+from secrets import token_hex
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from datetime import datetime
+from enum import Enum
+from typing import Annotated, Any, Dict, List, Mapping, Optional, Tuple, Union, get_args, get_origin
 from pathlib import Path
 
 import httpx
-from langchain_core.tools import tool
+import orjson
+from pydantic import BaseModel, Field
+from langchain_core.tools import StructuredTool, tool
+
+from report_genius.config import PROJECT_ROOT, TEMPLATES_DIR, REPORTS_DIR
+from report_genius.templates import (
+    PortableViewTemplate, Section, SectionType,
+    HeaderConfig, DetailConfig, TableConfig, TextConfig, ListConfig,
+    FieldDef, FieldFormat as TGFieldFormat, TableColumn,
+    LayoutConfig, PageHeaderFooterConfig, Alignment,
+)
+from report_genius.injection import (
+    analyze_and_inject, analyze_document, add_logo_placeholder, add_timestamp_token,
+    LABEL_NORMALIZATIONS,
+)
+
+# Rendering (optional - may fail if template_gen not in path)
+try:
+    from report_genius.rendering import DocxRenderer
+except ImportError:
+    DocxRenderer = None
 
 log = logging.getLogger(__name__)
 
 # ============== Configuration ==============
 
 QUERY_URL_TEMPLATE = "https://demo01service.kahua.com/v2/domains/Summit/projects/{project_id}/query?returnDefaultAttributes=true"
+
+
+@lru_cache(maxsize=512)
+def _query_url(project_id: int) -> str:
+    """Query URL for a project; a session touches few projects, so these are cached."""
+    return QUERY_URL_TEMPLATE.format(project_id=project_id)
+
+
 KAHUA_BASIC_AUTH = os.getenv("KAHUA_BASIC_AUTH")
 
+# Public base for download links returned by the tools
+REPORT_BASE_URL = os.getenv("REPORT_BASE_URL", "http://localhost:8000")
+
 
 def _auth_header_value() -> str:
     if not KAHUA_BASIC_AUTH:
@@ -29,12 +79,223 @@ def _auth_header_value() -> str:
            else f"Basic {KAHUA_BASIC_AUTH}"
 
 
-HEADERS_JSON = lambda: {"Content-Type": "application/json", "Authorization": _auth_header_value()}
+# Transient Kahua failures are retried here rather than by the LLM issuing another tool call
+KAHUA_MAX_RETRIES = int(os.getenv("RG_KAHUA_MAX_RETRIES", "3"))
+_RETRY_STATUS_CODES = frozenset({429, 502, 503, 504})
+_MAX_RETRY_DELAY = 10.0
+
+# HTTP/2 multiplexes concurrent Kahua calls over one connection; set RG_KAHUA_HTTP2=0 if the
+# server negotiates it poorly
+KAHUA_HTTP2 = os.getenv("RG_KAHUA_HTTP2", "1").lower() not in ("0", "false", "no")
+
+# Cap on in-flight async Kahua requests per event loop, so parallel tool calls don't trip rate limits
+KAHUA_MAX_CONCURRENCY = int(os.getenv("RG_KAHUA_MAX_CONCURRENCY", "8"))
+
+# Shared Kahua HTTP client (created lazily, reused across tool calls)
+_http_client: Optional[httpx.Client] = None
+_http_client_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _kahua_headers() -> Dict[str, str]:
+    # KAHUA_BASIC_AUTH is read once at import, so build the headers once; an unset value
+    # still raises lazily on first use. Bodies are pre-encoded with orjson, so the JSON
+    # content type is set explicitly
+    return {"Authorization": _auth_header_value(), "Content-Type": "application/json"}
+
+
+def _get_http_client() -> httpx.Client:
+    """Get the shared Kahua HTTP client, keeping connections alive between tool calls."""
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                # Connection-level retries happen in the transport; status retries in _kahua_post
+                transport = httpx.HTTPTransport(
+                    http2=KAHUA_HTTP2,
+                    retries=KAHUA_MAX_RETRIES,
+                    limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+                )
+                _http_client = httpx.Client(
+                    transport=transport,
+                    timeout=30.0,
+                    headers=_kahua_headers(),
+                )
+                atexit.register(_http_client.close)
+    return _http_client
+
+
+# Async clients are bound to an event loop, so keep one per loop
+_async_http_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, httpx.AsyncClient]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_async_http_client() -> httpx.AsyncClient:
+    """Get the Kahua async HTTP client for the running event loop."""
+    loop = asyncio.get_running_loop()
+    client = _async_http_clients.get(loop)
+    if client is None:
+        transport = httpx.AsyncHTTPTransport(
+            http2=KAHUA_HTTP2,
+            retries=KAHUA_MAX_RETRIES,
+            limits=httpx.Limits(max_keepalive_connections=20, max_connections=50),
+        )
+        client = httpx.AsyncClient(
+            transport=transport,
+            timeout=30.0,
+            headers=_kahua_headers(),
+        )
+        _async_http_clients[loop] = client
+    return client
+
+
+_async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_kahua_semaphore() -> asyncio.Semaphore:
+    """Get the request-limiting semaphore for the running event loop."""
+    loop = asyncio.get_running_loop()
+    sem = _async_semaphores.get(loop)
+    if sem is None:
+        sem = _async_semaphores[loop] = asyncio.Semaphore(KAHUA_MAX_CONCURRENCY)
+    return sem
+
+
+async def gather_bounded(coros, limit: int = KAHUA_MAX_CONCURRENCY) -> List[Any]:
+    """
+    Run coroutines concurrently with at most `limit` in flight.
+    
+    Args:
+        coros: Iterable of awaitables (e.g. tool.ainvoke(...) calls)
+        limit: Maximum number running at once
+    
+    Returns:
+        Results in the same order as `coros`.
+    """
+    sem = asyncio.Semaphore(limit)
+
+    async def _bounded(coro):
+        async with sem:
+            return await coro
+
+    return await asyncio.gather(*(_bounded(c) for c in coros))
+
+
+def _retry_delay(resp: httpx.Response, attempt: int) -> float:
+    """Seconds to wait before retrying, honouring a numeric Retry-After header."""
+    retry_after = resp.headers.get("Retry-After")
+    if retry_after:
+        try:
+            return min(max(float(retry_after), 0.0), _MAX_RETRY_DELAY)
+        except ValueError:
+            pass  # HTTP-date form, use exponential backoff
+    return min(0.5 * 2 ** attempt, _MAX_RETRY_DELAY)
+
+
+def _kahua_post(url: str, payload: dict, timeout: float) -> httpx.Response:
+    """POST a Kahua query, retrying 429/5xx gateway responses with backoff."""
+    client = _get_http_client()
+    content = orjson.dumps(payload)
+    for attempt in range(KAHUA_MAX_RETRIES + 1):
+        resp = client.post(url, content=content, timeout=timeout)
+        log.debug(f"Kahua {resp.http_version} {resp.status_code} {url}")
+        if resp.status_code not in _RETRY_STATUS_CODES or attempt == KAHUA_MAX_RETRIES:
+            return resp
+        delay = _retry_delay(resp, attempt)
+        log.warning(f"Kahua returned {resp.status_code}, retrying in {delay:.1f}s")
+        time.sleep(delay)
+    return resp
+
+
+async def _kahua_post_async(url: str, payload: dict, timeout: float) -> httpx.Response:
+    """Async variant of _kahua_post."""
+    client = _get_async_http_client()
+    sem = _get_kahua_semaphore()
+    content = orjson.dumps(payload)
+    for attempt in range(KAHUA_MAX_RETRIES + 1):
+        # Hold a slot only for the request itself, not the backoff sleep
+        async with sem:
+            resp = await client.post(url, content=content, timeout=timeout)
+        log.debug(f"Kahua {resp.http_version} {resp.status_code} {url}")
+        if resp.status_code not in _RETRY_STATUS_CODES or attempt == KAHUA_MAX_RETRIES:
+            return resp
+        delay = _retry_delay(resp, attempt)
+        log.warning(f"Kahua returned {resp.status_code}, retrying in {delay:.1f}s")
+        await asyncio.sleep(delay)
+    return resp
+
+
+def _kahua_tool(steps):
+    """
+    Turn a Kahua request generator into a tool with sync and async implementations.
+    
+    The generator yields ``(url, payload, timeout)`` for each Kahua query, receives the
+    response back, and returns the tool result. The sync path posts with the shared
+    client; the async path (used by the agent's ToolNode under ainvoke) awaits an
+    AsyncClient so several Kahua tool calls in one turn overlap on the event loop.
+    """
+    def drive(gen, resp=None):
+        try:
+            return None, gen.send(resp)
+        except StopIteration as stop:
+            return stop.value, None
+    
+    @functools.wraps(steps)
+    def run(*args, **kwargs):
+        gen = steps(*args, **kwargs)
+        result, request = drive(gen)
+        while request is not None:
+            result, request = drive(gen, _kahua_post(*request))
+        return result
+    
+    @functools.wraps(steps)
+    async def arun(*args, **kwargs):
+        gen = steps(*args, **kwargs)
+        result, request = drive(gen)
+        while request is not None:
+            result, request = drive(gen, await _kahua_post_async(*request))
+        return result
+    
+    return StructuredTool.from_function(func=run, coroutine=arun)
+
+
+# Short-lived cache for Kahua lookups that rarely change (project list, entity schemas)
+KAHUA_CACHE_TTL = float(os.getenv("RG_KAHUA_CACHE_TTL", "60"))
+_kahua_cache: Dict[Tuple, Tuple[float, Any]] = {}
+_kahua_cache_lock = threading.Lock()
+
+
+def _kahua_cache_get(key: Tuple) -> Any:
+    """Return a cached value, or None if missing or expired."""
+    with _kahua_cache_lock:
+        entry = _kahua_cache.get(key)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            del _kahua_cache[key]
+            return None
+        return entry[1]
+
+
+def _kahua_cache_put(key: Tuple, value: Any) -> None:
+    if KAHUA_CACHE_TTL > 0:
+        with _kahua_cache_lock:
+            _kahua_cache[key] = (time.monotonic() + KAHUA_CACHE_TTL, value)
+
+
+MAX_PROJECT_MATCHES = 20
 
 INJECTION_CONFIDENCE_THRESHOLD = float(os.getenv("RG_INJECTION_CONFIDENCE_THRESHOLD", "0.7"))
 
+# Include Python tracebacks in template tool errors (developer aid, off by default)
+TOOL_DEBUG = os.getenv("RG_TOOL_DEBUG", "").strip().lower() in {"1", "true", "yes"}
+
 # Entity aliases for friendly names
-ENTITY_ALIASES: Dict[str, str] = {
+# Read-only: shared by the tool schemas and resolve_entity_def
+ENTITY_ALIASES: Mapping[str, str] = types.MappingProxyType({
     "project": "kahua_Project.Project",
     "projects": "kahua_Project.Project",
     "rfi": "kahua_AEC_RFI.RFI",
@@ -51,13 +312,81 @@ ENTITY_ALIASES: Dict[str, str] = {
     "invoices": "kahua_ContractInvoice.ContractInvoice",
     "daily report": "kahua_AEC_DailyReport.DailyReport",
     "meeting": "kahua_Meeting.Meeting",
-}
+})
+
+
+_VALID_ALIASES = frozenset(ENTITY_ALIASES)
+
+# entity_def parameter of the Kahua query tools. A plain string with the known aliases
+# listed in its schema description; unknown values are rejected by _unknown_entity_error.
+EntityDef = Annotated[str, Field(description=(
+    f"Entity alias ({', '.join(ENTITY_ALIASES)}) or full definition like 'kahua_AEC_RFI.RFI'"
+))]
+
+
+# Aliases plus canonical defs mapped to themselves, so exact inputs resolve in one lookup
+_ENTITY_LOOKUP: Mapping[str, str] = types.MappingProxyType(
+    {**ENTITY_ALIASES, **{v: v for v in ENTITY_ALIASES.values()}}
+)
 
 
 def resolve_entity_def(name_or_def: str) -> str:
     """Resolve friendly entity name to full definition."""
-    key = (name_or_def or "").strip().lower()
-    return ENTITY_ALIASES.get(key, name_or_def)
+    if not name_or_def:
+        return name_or_def
+    hit = _ENTITY_LOOKUP.get(name_or_def)
+    if hit is not None:
+        return hit
+    return ENTITY_ALIASES.get(name_or_def.strip().lower(), name_or_def)
+
+
+def _unknown_entity_error(ent: str) -> Optional[dict]:
+    """Return an error result if ``ent`` is neither a known alias nor a full entity def."""
+    if "." in ent or ent.strip().lower() in _VALID_ALIASES:
+        return None
+    return {
+        "status": "error",
+        "message": f"Unknown entity: {ent}. Use an alias or a full definition like 'kahua_AEC_RFI.RFI'.",
+        "available": sorted(_VALID_ALIASES),
+    }
+
+
+_ENT_KEYS = ("entities", "results", "items")
+
+
+def _extract_entities(body: dict) -> Tuple[List[dict], int]:
+    """Extract the entity list and total count from a Kahua query response."""
+    count = body.get("count", 0)
+    for s in body.get("sets", ()):
+        v = s.get("entities")
+        if v and isinstance(v, list):
+            return v, count
+    for k in _ENT_KEYS:
+        v = body.get(k)
+        if isinstance(v, list):
+            return v, count
+    return [], count
+
+
+def _table_cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, (dict, list)):
+        value = orjson.dumps(value).decode()
+    return str(value).replace("|", "\\|").replace("\n", " ")
+
+
+def _to_table(rows: List[dict]) -> str:
+    """
+    Render rows as a pipe-delimited table: a header line of column names, then one line per row.
+    
+    Field names are stated once instead of on every row, which roughly halves the tokens the
+    model re-reads for a tool result. Nested values are inlined as JSON; literal pipes are escaped.
+    """
+    columns = list(dict.fromkeys(k for row in rows for k in row))
+    lines = ["|".join(columns)]
+    lines.extend("|".join(_table_cell(row.get(c)) for c in columns) for row in rows)
+    return "\n".join(lines)
 
 
 def _low_confidence_labels(placeholders: List[dict]) -> List[str]:
@@ -70,7 +399,23 @@ def _low_confidence_labels(placeholders: List[dict]) -> List[str]:
 
 # ============== Kahua API Tools ==============
 
-@tool
+def _match_projects(projects: List[dict], search_folded: str) -> List[dict]:
+    """Case-insensitive name match over a project list, capped at MAX_PROJECT_MATCHES."""
+    matches = []
+    for proj in projects:
+        name = proj.get("Name", proj.get("name", ""))
+        if search_folded in name.casefold():
+            matches.append({
+                "id": proj.get("Id", proj.get("id", proj.get("ProjectId"))),
+                "name": name,
+                "status": proj.get("Status", proj.get("status", "")),
+            })
+            if len(matches) >= MAX_PROJECT_MATCHES:
+                break
+    return matches
+
+
+@_kahua_tool
 def find_project(search_term: str) -> dict:
     """
     Find a project by name or partial match. ALWAYS use this when a user mentions a project by name.
@@ -79,50 +424,53 @@ def find_project(search_term: str) -> dict:
         search_term: Project name or partial name to search for (case-insensitive)
     
     Returns:
-        Dict with matching projects including their IDs, names, and key details.
+        Dict with matching projects including their IDs, names, and key details
+        (on no match, all_projects_table lists known projects as a pipe-delimited table).
     """
-    query_url = QUERY_URL_TEMPLATE.format(project_id=0)
-    qpayload = {"PropertyName": "Query", "EntityDef": "kahua_Project.Project"}
-    
-    with httpx.Client(timeout=20.0) as client:
-        resp = client.post(query_url, headers=HEADERS_JSON(), json=qpayload)
+    search_folded = search_term.casefold()
+    projects = _kahua_cache_get(("projects",))
+    if projects is None and len(search_term.strip()) >= 3:
+        # Let Kahua filter by name so only matching projects come over the wire
+        qpayload = {
+            "PropertyName": "Query",
+            "EntityDef": "kahua_Project.Project",
+            "Take": str(MAX_PROJECT_MATCHES),
+            "Partition": {"Scope": "Any"},
+            "Condition": [{"PropertyName": "Data", "Path": "Name", "Type": "Contains", "Value": search_term}],
+        }
+        resp = yield _query_url(0), qpayload, 20.0
+        if resp.status_code < 400:
+            matches = _match_projects(_extract_entities(orjson.loads(resp.content))[0], search_folded)
+            if matches:
+                return {"status": "ok", "matches": matches, "best_match": matches[0] if len(matches) == 1 else None}
+    
+    # Short terms and misses use the full project list, which also backs the no_match suggestions;
+    # different search terms filter the same list, so cache the list itself
+    if projects is None:
+        qpayload = {"PropertyName": "Query", "EntityDef": "kahua_Project.Project"}
+        
+        resp = yield _query_url(0), qpayload, 20.0
         if resp.status_code >= 400:
             return {"status": "error", "message": "Failed to query projects"}
-        body = resp.json()
-    
-    projects = []
-    for key in ("entities", "results", "items"):
-        if isinstance(body.get(key), list):
-            projects = body[key]
-            break
-    for s in body.get("sets", []):
-        if isinstance(s.get("entities"), list) and s["entities"]:
-            projects = s["entities"]
-            break
-    
-    search_lower = search_term.lower()
-    matches = []
-    for proj in projects:
-        name = proj.get("Name", proj.get("name", ""))
-        if search_lower in name.lower():
-            matches.append({
-                "id": proj.get("Id", proj.get("id", proj.get("ProjectId"))),
-                "name": name,
-                "status": proj.get("Status", proj.get("status", "")),
-            })
+        projects, _ = _extract_entities(orjson.loads(resp.content))
+        _kahua_cache_put(("projects",), projects)
+    
+    matches = _match_projects(projects, search_folded)
     
     if not matches:
         return {
             "status": "no_match",
             "search_term": search_term,
-            "all_projects": [{"id": p.get("Id", p.get("id")), "name": p.get("Name", p.get("name", ""))} for p in projects[:20]]
+            "all_projects_table": _to_table(
+                [{"id": p.get("Id", p.get("id")), "name": p.get("Name", p.get("name", ""))} for p in projects[:20]]
+            ),
         }
     
     return {"status": "ok", "matches": matches, "best_match": matches[0] if len(matches) == 1 else None}
 
 
-@tool
-def count_entities(entity_def: str, project_id: int = 0, scope: str = "Any") -> dict:
+@_kahua_tool
+def count_entities(entity_def: EntityDef, project_id: int = 0, scope: str = "Any") -> dict:
     """
     FAST count of a single entity type.
     
@@ -135,30 +483,58 @@ def count_entities(entity_def: str, project_id: int = 0, scope: str = "Any") ->
         Dict with count and entity info.
     """
     ent = resolve_entity_def(entity_def)
-    query_url = QUERY_URL_TEMPLATE.format(project_id=project_id)
+    error = _unknown_entity_error(ent)
+    if error:
+        return error
+    query_url = _query_url(project_id)
     qpayload: Dict[str, Any] = {"PropertyName": "Query", "EntityDef": ent, "Take": "1"}
     if scope:
         qpayload["Partition"] = {"Scope": scope}
     
-    with httpx.Client(timeout=15.0) as client:
-        resp = client.post(query_url, headers=HEADERS_JSON(), json=qpayload)
-        if resp.status_code >= 400:
-            return {"status": "error", "message": f"Failed to query {ent}"}
-        body = resp.json()
+    resp = yield query_url, qpayload, 15.0
+    if resp.status_code >= 400:
+        return {"status": "error", "message": f"Failed to query {ent}"}
+    body = orjson.loads(resp.content)
     
     count = body.get("count", 0)
     return {"status": "ok", "entity_def": ent, "count": count, "project_id": project_id}
 
 
-@tool
+# Fields shown to the model per query row unless include_fields is given; full rows stay
+# server-side under a result_id for get_full_entity
+_DEFAULT_PROJECTION = ("Id", "Number", "Name", "Subject", "Description", "Status", "Date", "DueDate")
+_PROJECTIONS: Mapping[str, Tuple[str, ...]] = types.MappingProxyType({
+    "kahua_Project.Project": ("Id", "Number", "Name", "Status"),
+    "kahua_AEC_RFI.RFI": ("Id", "Number", "Subject", "Status", "DueDate", "Author"),
+    "kahua_AEC_Submittal.Submittal": ("Id", "Number", "Revision", "Description", "Status", "DueDate"),
+    "kahua_Contract.Contract": ("Id", "Number", "Description", "Status", "Date"),
+    "kahua_ContractInvoice.ContractInvoice": ("Id", "Number", "Description", "Status", "Date", "DueDate"),
+})
+
+QUERY_RESULT_CACHE_SIZE = int(os.getenv("RG_QUERY_RESULT_CACHE_SIZE", "32"))
+_query_results: "OrderedDict[str, List[dict]]" = OrderedDict()
+_query_results_lock = threading.Lock()
+
+
+def _store_query_result(entities: List[dict]) -> str:
+    result_id = f"qr-{token_hex(4)}"
+    with _query_results_lock:
+        _query_results[result_id] = entities
+        while len(_query_results) > QUERY_RESULT_CACHE_SIZE:
+            _query_results.popitem(last=False)
+    return result_id
+
+
+@_kahua_tool
 def query_entities(
-    entity_def: str, 
+    entity_def: EntityDef,
     project_id: int = 0, 
     limit: int = 50,
     conditions_json: str = None,
     sort_by: str = None,
     sort_direction: str = "Ascending",
-    scope: str = "Any"
+    scope: str = "Any",
+    include_fields: Optional[List[str]] = None,
 ) -> dict:
     """
     Query entities with filtering and sorting.
@@ -171,12 +547,18 @@ def query_entities(
         sort_by: Field to sort by.
         sort_direction: "Ascending" or "Descending".
         scope: Query scope ("Any" for cross-project).
+        include_fields: Fields to return per row. Defaults to a few key fields; use
+            get_full_entity(result_id, index) for everything on one row.
     
     Returns:
-        Dict with entities list and count.
+        Dict with count, result_id and entities_table: a pipe-delimited table whose first
+        line is the header.
     """
     ent = resolve_entity_def(entity_def)
-    query_url = QUERY_URL_TEMPLATE.format(project_id=project_id)
+    error = _unknown_entity_error(ent)
+    if error:
+        return error
+    query_url = _query_url(project_id)
     
     qpayload: Dict[str, Any] = {"PropertyName": "Query", "EntityDef": ent, "Take": str(limit)}
     
@@ -185,7 +567,7 @@ def query_entities(
     
     if conditions_json:
         try:
-            conditions = json.loads(conditions_json)
+            conditions = orjson.loads(conditions_json)
             kahua_conditions = []
             for cond in conditions:
                 kahua_conditions.append({
@@ -196,32 +578,44 @@ def query_entities(
                 })
             if kahua_conditions:
                 qpayload["Condition"] = kahua_conditions
-        except json.JSONDecodeError:
+        except orjson.JSONDecodeError:
             pass
     
     if sort_by:
         qpayload["Sorts"] = [{"PropertyName": "Data", "Path": sort_by, "Direction": sort_direction}]
     
-    with httpx.Client(timeout=30.0) as client:
-        resp = client.post(query_url, headers=HEADERS_JSON(), json=qpayload)
-        body = resp.json() if resp.status_code < 400 else {}
+    resp = yield query_url, qpayload, 30.0
+    if resp.status_code >= 400:
+        return {"status": "error", "message": f"Failed to query {ent}"}
+    entities, count = _extract_entities(orjson.loads(resp.content))
+    result_id = _store_query_result(entities)
     
-    entities = []
-    count = body.get("count", 0)
-    for k in ("entities", "results", "items"):
-        if isinstance(body.get(k), list):
-            entities = body[k]
-            break
-    for s in body.get("sets", []):
-        if isinstance(s.get("entities"), list):
-            entities = s["entities"]
-            break
-    
-    return {"status": "ok", "entity_def": ent, "count": count, "returned": len(entities), "entities": entities}
+    keys = include_fields or _PROJECTIONS.get(ent, _DEFAULT_PROJECTION)
+    rows = [{k: e[k] for k in keys if k in e} for e in entities]
+    if not any(rows):
+        # None of the projected keys exist on this entity type; show full rows instead
+        rows = entities
+    return {"status": "ok", "entity_def": ent, "count": count, "returned": len(entities),
+            "result_id": result_id, "entities_table": _to_table(rows)}
 
 
-@tool
-def get_entity_schema(entity_def: str, project_id: int = 0) -> dict:
+_TYPE_NAMES = {t: t.__name__ for t in (str, int, float, bool, list, dict, type(None))}
+_SAMPLE_MAX_ITEMS = 10
+
+
+def _sample_value(v: Any) -> str:
+    """Short sample string for a field value; large containers are summarized, not stringified."""
+    if v is None:
+        return ""
+    if isinstance(v, str):
+        return v[:100]
+    if isinstance(v, (list, dict)) and len(v) > _SAMPLE_MAX_ITEMS:
+        return f"<{type(v).__name__} len={len(v)}>"
+    return str(v)[:100]
+
+
+@_kahua_tool
+def get_entity_schema(entity_def: EntityDef, project_id: int = 0) -> dict:
     """
     Get the field schema for an entity type by sampling a record.
     
@@ -230,33 +624,38 @@ def get_entity_schema(entity_def: str, project_id: int = 0) -> dict:
         project_id: Project context.
     
     Returns:
-        Dict with field names and sample values.
+        Dict with parallel "name", "type" and "sample" lists, sorted by field name.
     """
     ent = resolve_entity_def(entity_def)
-    query_url = QUERY_URL_TEMPLATE.format(project_id=project_id)
+    error = _unknown_entity_error(ent)
+    if error:
+        return error
+    cache_key = ("schema", ent, project_id)
+    cached = _kahua_cache_get(cache_key)
+    if cached is not None:
+        return cached
+    query_url = _query_url(project_id)
     qpayload = {"PropertyName": "Query", "EntityDef": ent, "Take": "1", "Partition": {"Scope": "Any"}}
     
-    with httpx.Client(timeout=15.0) as client:
-        resp = client.post(query_url, headers=HEADERS_JSON(), json=qpayload)
-        if resp.status_code >= 400:
-            return {"status": "error", "message": f"Failed to query {ent}"}
-        body = resp.json()
-    
-    sample = None
-    for key in ("entities", "results", "items"):
-        if isinstance(body.get(key), list) and body[key]:
-            sample = body[key][0]
-            break
-    for s in body.get("sets", []):
-        if isinstance(s.get("entities"), list) and s["entities"]:
-            sample = s["entities"][0]
-            break
+    resp = yield query_url, qpayload, 15.0
+    if resp.status_code >= 400:
+        return {"status": "error", "message": f"Failed to query {ent}"}
+    entities, _ = _extract_entities(orjson.loads(resp.content))
+    sample = entities[0] if entities else None
     
     if not sample:
-        return {"status": "ok", "entity_def": ent, "fields": [], "message": "No records found"}
+        return {"status": "ok", "entity_def": ent, "fields": {"name": [], "type": [], "sample": []},
+                "message": "No records found"}
     
-    fields = [{"name": k, "type": type(v).__name__, "sample": str(v)[:100]} for k, v in sample.items()]
-    return {"status": "ok", "entity_def": ent, "fields": sorted(fields, key=lambda x: x["name"])}
+    items = sorted(sample.items())
+    fields = {
+        "name": [k for k, _ in items],
+        "type": [_TYPE_NAMES.get(type(v)) or type(v).__name__ for _, v in items],
+        "sample": [_sample_value(v) for _, v in items],
+    }
+    result = {"status": "ok", "entity_def": ent, "fields": fields}
+    _kahua_cache_put(cache_key, result)
+    return result
 
 
 @tool
@@ -267,48 +666,375 @@ def generate_report(
     charts_json: str = None
 ) -> dict:
     """
-    Generate an ANALYTICS REPORT document from markdown and charts.
-    
-    THIS IS NOT FOR TEMPLATES!
-    For templates/portable views, use build_custom_template instead.
-    
-    This tool creates ONE-TIME REPORTS with:
-    - Actual data values (not placeholders)
-    - Dark blue header banner with the title
-    - Charts and analysis
-    
-    For Kahua portable view templates (reusable templates with placeholders like
-    [Attribute(Number)]), use `build_custom_template` + `render_smart_template` instead.
+    Generate an ANALYTICS REPORT (actual data, not a template) from markdown and charts.
     
     Args:
-        title: Report title (appears in dark blue banner).
+        title: Report title (appears in banner).
         markdown_content: Body content with actual data values.
         subtitle: Optional subtitle.
         charts_json: JSON array of chart specs.
-    
-    Returns:
-        Dict with filename and download URL.
     """
     try:
         from report_generator import create_report
-        charts = json.loads(charts_json) if charts_json else None
+        charts = orjson.loads(charts_json) if charts_json else None
         result = create_report(title=title, markdown_content=markdown_content, charts=charts, subtitle=subtitle)
         filename = result["filename"]
-        base_url = os.getenv("REPORT_BASE_URL", "http://localhost:8000")
-        return {"status": "ok", "filename": filename, "download_url": f"{base_url}/reports/{filename}"}
+        return {"status": "ok", "filename": filename, "download_url": f"{REPORT_BASE_URL}/reports/{filename}"}
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
 
 
 # ============== Collect Kahua API tools ==============
 
-KAHUA_API_TOOLS = [find_project, count_entities, query_entities, get_entity_schema, generate_report]
+@tool
+def get_full_entity(result_id: str, index: int) -> dict:
+    """
+    Get every field of one row from an earlier query_entities result.
+    
+    Args:
+        result_id: result_id returned by query_entities
+        index: Zero-based row index in that result's entities_table
+    """
+    with _query_results_lock:
+        entities = _query_results.get(result_id)
+        if entities is not None:
+            _query_results.move_to_end(result_id)
+    if entities is None:
+        return {"status": "error", "message": f"Result {result_id} expired; re-run query_entities"}
+    if not 0 <= index < len(entities):
+        return {"status": "error", "message": f"Index out of range (0-{len(entities) - 1})"}
+    return {"status": "ok", "entity": entities[index]}
+
+
+KAHUA_API_TOOLS = [find_project, count_entities, query_entities, get_full_entity, get_entity_schema, generate_report]
 
 
 # ============== SOTA Template Tools ==============
 
-# Storage for templates being built interactively
-_active_templates: Dict[str, dict] = {}
+# Parsed templates keyed by template_id, invalidated by file (mtime_ns, size). Templates
+# built or modified in this session are stored here directly on save. Bounded LRU, shared
+# with the background writer thread.
+TEMPLATE_CACHE_SIZE = int(os.getenv("RG_TEMPLATE_CACHE_SIZE", "64"))
+_template_cache: "OrderedDict[str, Tuple[Tuple[int, int], Any]]" = OrderedDict()
+_template_cache_lock = threading.Lock()
+
+
+def _file_stamp(path: Path) -> Tuple[int, int]:
+    st = path.stat()
+    return st.st_mtime_ns, st.st_size
+
+
+def _cache_template(template_id: str, stamp: Tuple[int, int], template) -> None:
+    with _template_cache_lock:
+        _template_cache[template_id] = (stamp, template)
+        _template_cache.move_to_end(template_id)
+        while len(_template_cache) > TEMPLATE_CACHE_SIZE:
+            _template_cache.popitem(last=False)
+
+
+# Field lookups keyed by entity type (schemas are static for the process)
+_field_lookups: Dict[str, Dict[str, Tuple[str, str, Any, str, str]]] = {}
+
+# Lowercased entity type -> tg_schemas key, built on first use and rebuilt if the
+# schema mapping is replaced or grows (stamp is (id, len) of tg_schemas)
+_entity_keys: Dict[str, str] = {}
+_entity_keys_stamp: Tuple[int, int] = (0, 0)
+
+# Schema field category -> placeholder format (anything else renders as text)
+_CATEGORY_FORMATS = {
+    "financial": TGFieldFormat.CURRENCY,
+    "date": TGFieldFormat.DATE,
+    "numeric": TGFieldFormat.NUMBER,
+}
+_TEXT_FORMAT = TGFieldFormat.TEXT
+
+_ALIGNMENTS = {"left": Alignment.LEFT, "center": Alignment.CENTER, "right": Alignment.RIGHT}
+
+# Identity field paths (lowercased) used for an auto-created header's title and subtitle
+_TITLE_KEYS = frozenset({"number", "id", "reference"})
+_SUBTITLE_KEYS = frozenset({"subject", "name", "title", "description"})
+
+# Template files are written by one background worker so tools return without
+# waiting on disk; readers wait on a pending write for the same template first.
+_template_writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rg-template-writer")
+_pending_writes: Dict[str, Future] = {}
+
+# Newest unwritten content per template. Saves that arrive before the worker gets
+# to a template (e.g. several quick modify calls) collapse into one write; the flushes
+# queued by the later saves then find nothing left to write.
+_queued_saves: Dict[str, Tuple[Path, bytes]] = {}
+_queued_saves_lock = threading.Lock()
+
+
+# Marks template files written by _template_json_bytes; only these are trusted to load
+# without validation. Bump when the dump format changes.
+_TEMPLATE_FORMAT_KEY = "_rg_format"
+_TEMPLATE_FORMAT = 1
+
+
+def _template_json_bytes(template) -> bytes:
+    """Serialize a template to compact JSON, omitting unset optional (None) fields."""
+    # orjson handles datetimes and enums itself, so skip pydantic's JSON-mode coercion.
+    # The files are only read back by tools, so no indentation.
+    data = template.model_dump(exclude_none=True)
+    data[_TEMPLATE_FORMAT_KEY] = _TEMPLATE_FORMAT
+    return orjson.dumps(data)
+
+
+def _write_template_json(json_path: Path, template) -> None:
+    """Write a template to disk as compact orjson (see _template_json_bytes)."""
+    json_path.write_bytes(_template_json_bytes(template))
+
+
+def _construct_value(annotation, value):
+    """Convert a trusted JSON value to ``annotation`` without running validation."""
+    if value is None:
+        return None
+    origin = get_origin(annotation)
+    if origin is list:
+        (item_type,) = get_args(annotation) or (Any,)
+        return [_construct_value(item_type, v) for v in value]
+    if origin is Union or origin is types.UnionType:
+        args = [a for a in get_args(annotation) if a is not type(None)]
+        return _construct_value(args[0], value) if len(args) == 1 else value
+    if isinstance(annotation, type):
+        if issubclass(annotation, BaseModel) and isinstance(value, dict):
+            return _construct_model(annotation, value)
+        if issubclass(annotation, Enum):
+            return annotation(value)
+        if annotation is datetime and isinstance(value, str):
+            return datetime.fromisoformat(value)
+    return value
+
+
+def _construct_model(model_cls, data: dict):
+    """Recursively build a model from data we wrote ourselves (model_construct, no validation)."""
+    values = {
+        name: _construct_value(field.annotation, data[name])
+        for name, field in model_cls.model_fields.items()
+        if name in data
+    }
+    return model_cls.model_construct(**values)
+
+
+def _template_from_dict(data: dict):
+    """
+    Build a template from a dict, skipping validation only for dumps this module wrote.
+    
+    Anything else (older or hand-edited files, analyzer output) is validated, so missing
+    required fields are reported instead of producing a half-built template.
+    """
+    if data.get(_TEMPLATE_FORMAT_KEY) == _TEMPLATE_FORMAT:
+        try:
+            return _construct_model(PortableViewTemplate, data)
+        except (TypeError, ValueError):
+            pass
+    return PortableViewTemplate.model_validate(data)
+
+
+def _read_template_json(json_path: Path):
+    """Load a template from its JSON file, skipping validation for well-formed files."""
+    return _template_from_dict(orjson.loads(json_path.read_bytes()))
+
+
+def template_document(json_path: Path) -> Dict[str, Any]:
+    """
+    Load a template file in its public JSON shape (every field, nulls included).
+    
+    Files saved by these tools are compact and carry a private format marker, so they are
+    expanded through the model; other files are returned as stored.
+    """
+    data = orjson.loads(json_path.read_bytes())
+    if data.get(_TEMPLATE_FORMAT_KEY) is None:
+        return data
+    return _template_from_dict(data).model_dump(mode="json")
+
+
+def _atomic_write(path: Path, data: bytes) -> None:
+    """Write data via a uniquely named temp file and os.replace, so readers never see a partial file."""
+    fd, tmp = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.chmod(tmp, 0o644)  # mkstemp creates 0600; served files must stay readable
+        os.replace(tmp, path)
+    except BaseException:
+        Path(tmp).unlink(missing_ok=True)
+        raise
+
+
+def _log_write_error(future: Future) -> None:
+    if future.exception() is not None:
+        log.error(f"Template write failed: {future.exception()}")
+
+
+def _flush_template(template_id: str) -> None:
+    """Write the newest queued content for a template (no-op if already written)."""
+    with _queued_saves_lock:
+        queued = _queued_saves.pop(template_id, None)
+    if queued is None:
+        return
+    json_path, blob = queued
+    _atomic_write(json_path, blob)
+    # Cache a template built from the written bytes, not the caller's object, so the
+    # cache always matches the file under its stamp
+    _cache_template(template_id, _file_stamp(json_path), _template_from_dict(orjson.loads(blob)))
+
+
+def _save_template(template_id: str, json_path: Path, template) -> None:
+    """Queue a template write; a copy of the saved content is cached once it is on disk."""
+    # Serialize now: callers may keep mutating the object after returning
+    blob = _template_json_bytes(template)
+    
+    with _queued_saves_lock:
+        _queued_saves[template_id] = (json_path, blob)
+        # Every save registers its own flush; the single worker runs them in order, so
+        # waiting on the newest one covers this content even when an earlier flush wrote it
+        future = _template_writer.submit(_flush_template, template_id)
+        _pending_writes[template_id] = future
+    
+    future.add_done_callback(_log_write_error)
+    # Drop the entry once written so templates that are never read again don't accumulate
+    future.add_done_callback(functools.partial(_forget_write, template_id))
+
+
+def _forget_write(template_id: str, future: Future) -> None:
+    with _queued_saves_lock:
+        if _pending_writes.get(template_id) is future:
+            del _pending_writes[template_id]
+
+
+def saved_template_path(template_id: str) -> Path:
+    """
+    Path of a saved template, waiting for any queued write of it to finish.
+    
+    Tools save templates in the background, so anything reading TEMPLATES_DIR (e.g. the
+    server's template endpoints) should resolve paths through this.
+    """
+    with _queued_saves_lock:
+        future = _pending_writes.get(template_id)
+    if future is not None:
+        future.result()
+    return TEMPLATES_DIR / f"{template_id}.json"
+
+
+def _load_template_cached(template_id: str, json_path: Path):
+    """Load a template, reusing the parsed object while the file is unchanged."""
+    stamp = _file_stamp(json_path)
+    with _template_cache_lock:
+        cached = _template_cache.get(template_id)
+        if cached is not None and cached[0] == stamp:
+            _template_cache.move_to_end(template_id)
+            return cached[1]
+    template = _read_template_json(json_path)
+    _cache_template(template_id, stamp, template)
+    return template
+
+
+def _get_field_lookup(entity_key: str, schema) -> Dict[str, Tuple[str, str, Any, str, str]]:
+    """
+    Get the path/label -> (path, label, format, path_lower, label_lower) lookup for a schema,
+    built once per entity type.
+    
+    The placeholder format and lowercase forms are computed here, so resolving a field (and
+    checking it against bold_fields) in a tool call needs no per-field string work.
+    """
+    field_lookup = _field_lookups.get(entity_key)
+    if field_lookup is None:
+        field_lookup = {}
+        for f in schema.fields:
+            path = sys.intern(f.path)
+            path_lower, label_lower = path.lower(), f.label.lower()
+            entry = (
+                path, f.label, _CATEGORY_FORMATS.get(f.category.value, _TEXT_FORMAT), path_lower, label_lower
+            )
+            field_lookup[path] = entry
+            field_lookup[path_lower] = entry
+            field_lookup[label_lower] = entry
+        _field_lookups[entity_key] = field_lookup
+    return field_lookup
+
+
+# Entity type -> (title path, subtitle path) for an auto-created header
+_header_defaults: Dict[str, Tuple[str, str]] = {}
+
+
+def _get_header_defaults(entity_key: str, schema) -> Tuple[str, str]:
+    """Pick the auto-header title/subtitle paths from a schema's identity fields, once per entity type."""
+    defaults = _header_defaults.get(entity_key)
+    if defaults is None:
+        title_field_path = "Number"
+        subtitle_field_path = "Subject"
+        for f in schema.fields:
+            if f.category.value == "identity":
+                path_lower = f.path.lower()
+                if path_lower in _TITLE_KEYS:
+                    title_field_path = f.path
+                elif path_lower in _SUBTITLE_KEYS:
+                    subtitle_field_path = f.path
+        defaults = _header_defaults[entity_key] = (title_field_path, subtitle_field_path)
+    return defaults
+
+
+# Section config class -> (has fields, has table columns, has column layout, has logo flag)
+_config_shapes: Dict[type, Tuple[bool, bool, bool, bool]] = {}
+
+
+def _config_shape(cfg) -> Tuple[bool, bool, bool, bool]:
+    """Describe what a section config holds, computed once per config class."""
+    cfg_type = type(cfg)
+    shape = _config_shapes.get(cfg_type)
+    if shape is None:
+        model_fields = getattr(cfg_type, "model_fields", {})
+        columns = model_fields.get("columns")
+        is_table = columns is not None and get_origin(columns.annotation) is list
+        shape = ("fields" in model_fields, is_table, columns is not None and not is_table, "show_logo" in model_fields)
+        _config_shapes[cfg_type] = shape
+    return shape
+
+
+def _section_fields(cfg) -> list:
+    """Fields shown by a section: header/detail fields or table column fields."""
+    has_fields, is_table, _, _ = _config_shape(cfg)
+    if has_fields:
+        return cfg.fields
+    if is_table:
+        return [c.field for c in cfg.columns]
+    return []
+
+
+def _section_summary(section, default_title: str = "(header)") -> dict:
+    """Short description of a section for tool responses."""
+    fields = _section_fields(section.get_config())
+    return {
+        "type": section.type.value,
+        "title": section.title or default_title,
+        "field_count": len(fields),
+        "fields": [f.label for f in fields[:5]],
+    }
+
+
+def _tool_error(e: Exception) -> dict:
+    """Error result for a failed tool call; the traceback is only formatted when TOOL_DEBUG is set."""
+    result = {"status": "error", "message": str(e), "error_type": type(e).__name__}
+    if TOOL_DEBUG:
+        result["trace"] = traceback.format_exc()
+    else:
+        # Logging formats exc_info only if a DEBUG handler actually emits the record
+        log.debug("Tool failed", exc_info=True)
+    return result
+
+
+def _resolve_entity_key(system, entity_type: str) -> Optional[str]:
+    """Case-insensitive lookup of an entity type in the unified schemas."""
+    global _entity_keys_stamp
+    schemas = system.tg_schemas
+    stamp = (id(schemas), len(schemas))
+    if stamp != _entity_keys_stamp:
+        _entity_keys.clear()
+        _entity_keys.update((key.lower(), key) for key in schemas)
+        _entity_keys_stamp = stamp
+    return _entity_keys.get(entity_type.lower())
 
 
 def _get_unified_system():
@@ -319,34 +1045,14 @@ def _get_unified_system():
 
 @tool
 def list_template_archetypes() -> dict:
-    """
-    List available template archetypes (design patterns).
-    
-    Each archetype is optimized for a specific document purpose:
-    - formal_document: Contracts, agreements requiring signatures
-    - executive_summary: Quick overview for leadership
-    - financial_report: Cost breakdowns, line items, totals
-    - correspondence: RFIs, submittals with Q&A pattern
-    - field_report: Observations, inspections
-    - checklist: Punch lists, inspection items
-    
-    Returns:
-        Dict with list of archetypes and descriptions
-    """
+    """List available template archetypes (design patterns) with descriptions."""
     system = _get_unified_system()
     return {"status": "ok", "archetypes": system.get_archetypes()}
 
 
 @tool
 def list_template_entities() -> dict:
-    """
-    List entity types available for SOTA template generation.
-    
-    These are pre-analyzed entity schemas with intelligent field categorization.
-    
-    Returns:
-        Dict with list of entities and their field counts
-    """
+    """List entity types available for template generation, with field counts."""
     system = _get_unified_system()
     entities = []
     for name, schema in system.tg_schemas.items():
@@ -367,24 +1073,15 @@ def smart_compose_template(
     name: str = None
 ) -> dict:
     """
-    Create a professional template using SOTA AI-powered composition.
-    
-    This tool uses intelligent design patterns to create well-structured
-    templates with proper visual hierarchy, field grouping, and Kahua syntax.
+    Create a template automatically from a design archetype (PREFERRED for quick templates).
     
     Args:
         entity_type: Entity type (e.g., "Invoice", "RFI", "ExpenseContract")
-        archetype: Optional design pattern ("financial_report", "correspondence", etc.)
-                  Auto-inferred if not provided.
+        archetype: Optional design pattern; auto-inferred if not provided
         user_intent: Natural language description (e.g., "executive summary for board")
         name: Custom template name
-    
-    Returns:
-        Dict with template structure and sections summary
     """
     try:
-        from report_genius.config import TEMPLATES_DIR
-        
         system = _get_unified_system()
         template = system.compose_smart(
             entity_type=entity_type,
@@ -394,24 +1091,10 @@ def smart_compose_template(
         )
         
         # Save to disk
-        TEMPLATES_DIR.mkdir(parents=True, exist_ok=True)
         json_path = TEMPLATES_DIR / f"{template.id}.json"
-        json_path.write_text(template.model_dump_json(indent=2))
-        
-        # Build summary
-        sections_summary = []
-        for s in template.get_sections_ordered():
-            config = s.get_config()
-            field_count = 0
-            if hasattr(config, 'fields'):
-                field_count = len(config.fields)
-            elif hasattr(config, 'columns'):
-                field_count = len(config.columns)
-            sections_summary.append({
-                "type": s.type.value,
-                "title": s.title or "(header)",
-                "field_count": field_count,
-            })
+        _save_template(template.id, json_path, template)
+        
+        sections_summary = [_section_summary(s) for s in template.get_sections_ordered()]
         
         return {
             "status": "ok",
@@ -423,85 +1106,55 @@ def smart_compose_template(
             "saved_to": str(json_path),
         }
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
 
 
 @tool
 def render_smart_template(template_id: str, output_name: str = None) -> dict:
     """
-    Render a SOTA template to Word document with Kahua placeholder syntax.
-    
-    The generated DOCX contains proper Kahua placeholders like:
-    - [Attribute(Path)] for text fields
-    - [Currency(Source=Attribute,Path=...,Format="C2")] for money
-    - [Date(Source=Attribute,Path=...,Format="d")] for dates
-    - [StartTable(...)] / [EndTable] for collections
-    
-    This is ready to be uploaded to Kahua configuration.
+    Render a saved template to a DOCX with Kahua placeholder syntax.
     
     Args:
-        template_id: Template ID from smart_compose_template
+        template_id: Template ID from smart_compose_template / build_custom_template
         output_name: Optional custom filename (without extension)
-    
-    Returns:
-        Dict with download URL for the generated document
     """
     try:
-        from report_genius.templates import PortableViewTemplate
-        from report_genius.config import TEMPLATES_DIR, REPORTS_DIR
-        
         # Find template
-        json_path = TEMPLATES_DIR / f"{template_id}.json"
+        json_path = saved_template_path(template_id)
         
         if not json_path.exists():
             return {"status": "error", "message": f"Template {template_id} not found"}
         
         # Load and render
-        template = PortableViewTemplate.model_validate_json(json_path.read_text())
+        template = _load_template_cached(template_id, json_path)
         system = _get_unified_system()
         
-        REPORTS_DIR.mkdir(exist_ok=True)
-        
         filename = output_name or template_id
         docx_path = REPORTS_DIR / f"{filename}.docx"
         system.render_to_docx(template, docx_path)
         
-        base_url = os.getenv("REPORT_BASE_URL", "http://localhost:8000")
-        
         return {
             "status": "ok",
             "filename": docx_path.name,
-            "download_url": f"{base_url}/reports/{docx_path.name}",
+            "download_url": f"{REPORT_BASE_URL}/reports/{docx_path.name}",
             "template_name": template.name,
         }
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
 
 
 @tool
 def get_entity_fields(entity_type: str, category: str = None) -> dict:
     """
-    Show all available fields for an entity type, organized by category.
-    
-    USE THIS FIRST when a user asks for a template - show them what fields
-    are available so they can tell you what they want included.
+    Show available fields for an entity type, organized by category. Use before building a template.
     
     Args:
         entity_type: Entity type (e.g., "Invoice", "RFI", "ExpenseContract")
-        category: Optional filter - "identity", "financial", "date", "contact", 
-                 "text_block", "status", "collection", etc.
-    
-    Returns:
-        Dict with fields organized by category, with labels and suggested formats
+        category: Optional filter ("identity", "financial", "date", "contact", "status", ...)
     """
     try:
         system = _get_unified_system()
-        entity_key = None
-        entity_lower = entity_type.lower()
-        for key in system.tg_schemas:
-            if key.lower() == entity_lower:
-                entity_key = key
-                break
+        entity_key = _resolve_entity_key(system, entity_type)
         
         if not entity_key:
             return {"status": "error", "message": f"Unknown entity: {entity_type}", 
@@ -509,20 +1162,19 @@ def get_entity_fields(entity_type: str, category: str = None) -> dict:
         
         schema = system.tg_schemas[entity_key]
         
-        # Organize fields by category
+        # Organize fields by category as parallel lists (compact in the tool response)
         fields_by_category = {}
         for field_info in schema.fields:
             cat = field_info.category.value
             if category and cat != category:
                 continue
-            if cat not in fields_by_category:
-                fields_by_category[cat] = []
-            fields_by_category[cat].append({
-                "path": field_info.path,
-                "label": field_info.label,
-                "format": field_info.format_hint or "text",
-                "is_optional": field_info.is_optional,
-            })
+            columns = fields_by_category.get(cat)
+            if columns is None:
+                columns = fields_by_category[cat] = {"path": [], "label": [], "format": [], "is_optional": []}
+            columns["path"].append(field_info.path)
+            columns["label"].append(field_info.label)
+            columns["format"].append(field_info.format_hint or "text")
+            columns["is_optional"].append(field_info.is_optional)
         
         return {
             "status": "ok",
@@ -532,7 +1184,82 @@ def get_entity_fields(entity_type: str, category: str = None) -> dict:
             "total_fields": len(schema.fields),
         }
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
+
+
+# ---- Section builders for build_custom_template, dispatched on SectionType ----
+
+def _make_header_config(
+    title_path: str, subtitle_path: Optional[str], fields: List[FieldDef], header_style: dict
+) -> HeaderConfig:
+    """Header config shared by requested header sections and the auto-created one."""
+    return HeaderConfig(
+        title_template=f"{{{title_path}}}",
+        subtitle_template=f"{{{subtitle_path}}}" if subtitle_path else None,
+        fields=fields,
+        **header_style,
+    )
+
+
+def _build_header_section(spec: dict, order: int, resolve_field, header_style: dict) -> Section:
+    field_defs = [resolve_field(f) for f in spec.get("fields", [])]
+    config = _make_header_config(
+        field_defs[0].path if field_defs else "Number",
+        field_defs[1].path if len(field_defs) > 1 else None,
+        field_defs[2:],
+        header_style,
+    )
+    return Section.model_construct(type=SectionType.HEADER, order=order, header_config=config)
+
+
+def _build_detail_section(spec: dict, order: int, resolve_field, header_style: dict) -> Section:
+    formatting = spec.get("formatting", {})
+    bold_fields = frozenset(bf.lower() for bf in formatting.get("bold_fields", ()))
+    field_defs = [resolve_field(f, bold_fields) for f in spec.get("fields", [])]
+    config = DetailConfig(fields=field_defs, columns=formatting.get("columns", 2))
+    return Section.model_construct(
+        type=SectionType.DETAIL, title=spec.get("title", ""), order=order, detail_config=config
+    )
+
+
+def _build_table_section(spec: dict, order: int, resolve_field, header_style: dict) -> Section:
+    fields = spec.get("fields", [])
+    source = spec.get("source", fields[0] if fields else "Items")
+    columns = [TableColumn(field=resolve_field(f)) for f in fields]
+    config = TableConfig(source=source, columns=columns, show_header=True)
+    return Section.model_construct(
+        type=SectionType.TABLE, title=spec.get("title", ""), order=order, table_config=config
+    )
+
+
+def _build_text_section(spec: dict, order: int, resolve_field, header_style: dict) -> Section:
+    fields = spec.get("fields", [])
+    content = spec.get("content", "")
+    if not content and fields:
+        content = "\n\n".join(f"{{{f}}}" for f in fields)
+    return Section.model_construct(
+        type=SectionType.TEXT, title=spec.get("title", ""), order=order,
+        text_config=TextConfig(content=content),
+    )
+
+
+def _build_list_section(spec: dict, order: int, resolve_field, header_style: dict) -> Section:
+    config = ListConfig(
+        list_type=spec.get("list_type", "bullet"),
+        items=spec.get("items", spec.get("fields", [])),
+    )
+    return Section.model_construct(
+        type=SectionType.LIST, title=spec.get("title", ""), order=order, list_config=config
+    )
+
+
+_SECTION_BUILDERS = {
+    SectionType.HEADER: _build_header_section,
+    SectionType.DETAIL: _build_detail_section,
+    SectionType.TABLE: _build_table_section,
+    SectionType.TEXT: _build_text_section,
+    SectionType.LIST: _build_list_section,
+}
 
 
 @tool
@@ -548,56 +1275,24 @@ def build_custom_template(
     page_footer_json: str = None
 ) -> dict:
     """
-    Build a portable view template with Kahua placeholders.
-    
-    THIS CREATES AN ACTUAL TEMPLATE WITH PLACEHOLDERS - not a specification document.
-    The output is a Word document ready to be used with Kahua data.
+    Build a portable view template with Kahua placeholders (see TOOL REFERENCE for specs).
     
     Args:
         entity_type: Entity type (e.g., "Invoice", "RFI")
         name: Template name (for identification, not displayed in document)
-        sections_json: JSON array of section specs. Each section:
-            {
-                "type": "header" | "detail" | "table" | "text" | "list",
-                "title": "Section Title" (optional),
-                "fields": ["FieldPath1", "FieldPath2", ...],
-                "formatting": {
-                    "bold_fields": ["FieldPath1"],
-                    "columns": 2,
-                },
-                "list_type": "bullet" | "number",
-                "items": ["Item 1", "Item 2 with {Field}"]
-            }
+        sections_json: JSON array of section specs
         include_logo: Whether to include company logo placeholder
         layout: "single_column" or "two_column"
-        static_title: A literal text title to display (e.g., "Beaus RFI Template")
-        title_style_json: JSON object for title styling:
-            {"font": "Comic Sans MS", "size": 28, "color": "#0000FF", "bold": true, "alignment": "center"}
+        static_title: Literal title text shown at the top of the document
+        title_style_json: JSON object for title styling
         page_header_json: JSON object for page header config
         page_footer_json: JSON object for page footer config
-    
-    Returns:
-        Dict with template_id and structure summary
     """
     try:
-        import uuid
-        from report_genius.templates import (
-            PortableViewTemplate, Section, SectionType,
-            HeaderConfig, DetailConfig, TableConfig, TextConfig, ListConfig,
-            FieldDef, FieldFormat as TGFieldFormat, TableColumn,
-            LayoutConfig, PageHeaderFooterConfig, Alignment,
-        )
-        from report_genius.config import TEMPLATES_DIR
-        
         system = _get_unified_system()
         
         # Resolve entity
-        entity_key = None
-        entity_lower = entity_type.lower()
-        for key in system.tg_schemas:
-            if key.lower() == entity_lower:
-                entity_key = key
-                break
+        entity_key = _resolve_entity_key(system, entity_type)
         
         if not entity_key:
             return {"status": "error", "message": f"Unknown entity: {entity_type}"}
@@ -605,156 +1300,86 @@ def build_custom_template(
         schema = system.tg_schemas[entity_key]
         
         # Parse sections
-        sections_spec = json.loads(sections_json)
-        
-        # Build field lookup for format hints
-        field_lookup = {f.path: f for f in schema.fields}
-        field_lookup.update({f.path.lower(): f for f in schema.fields})
-        field_lookup.update({f.label.lower(): f for f in schema.fields})
-        
-        def resolve_field(field_name: str) -> FieldDef:
-            """Resolve a field name to FieldDef with proper formatting."""
-            f = field_lookup.get(field_name) or field_lookup.get(field_name.lower())
-            if f:
-                fmt = TGFieldFormat.TEXT
-                if f.category.value == "financial":
-                    fmt = TGFieldFormat.CURRENCY
-                elif f.category.value == "date":
-                    fmt = TGFieldFormat.DATE
-                elif f.category.value == "numeric":
-                    fmt = TGFieldFormat.NUMBER
-                return FieldDef(path=f.path, label=f.label, format=fmt)
-            return FieldDef(path=field_name, label=field_name.replace("_", " ").title(), format=TGFieldFormat.TEXT)
-        
-        # Build sections
+        sections_spec = orjson.loads(sections_json)
+        
+        # Field lookup for format hints
+        field_lookup = _get_field_lookup(entity_key, schema)
+        
+        def resolve_field(field_name: str, bold_fields: frozenset = frozenset()) -> FieldDef:
+            """Resolve a field name to FieldDef with proper formatting, bolding it if listed."""
+            entry = field_lookup.get(field_name) or field_lookup.get(field_name.lower())
+            if entry:
+                path, label, fmt, path_lower, label_lower = entry
+            else:
+                path, label, fmt = field_name, field_name.replace("_", " ").title(), _TEXT_FORMAT
+                path_lower, label_lower = path.lower(), label.lower()
+            if bold_fields and (path_lower in bold_fields or label_lower in bold_fields):
+                return FieldDef.model_construct(path=path, label=label, format=fmt, emphasis="bold")
+            return FieldDef.model_construct(path=path, label=label, format=fmt)
+        
+        # Build sections (section wrappers and resolved fields are built from known-good
+        # values, so they skip validation; the per-type configs are still validated)
         built_sections = []
-        has_header = any(spec.get("type") == "header" for spec in sections_spec)
+        has_header = False
+        for spec in sections_spec:
+            if spec.get("type") == "header":
+                has_header = True
+                break
+        auto_header = not has_header and include_logo
         
         # Parse title style
         title_style = {}
         if title_style_json:
             try:
-                title_style = json.loads(title_style_json)
-            except:
+                title_style = orjson.loads(title_style_json)
+            except orjson.JSONDecodeError:
                 pass
         
-        align_map = {"left": Alignment.LEFT, "center": Alignment.CENTER, "right": Alignment.RIGHT}
-        title_alignment = align_map.get(title_style.get("alignment", "left"), Alignment.LEFT)
+        header_style = {
+            "show_logo": include_logo,
+            "static_title": static_title,
+            "title_font": title_style.get("font"),
+            "title_size": title_style.get("size"),
+            "title_color": title_style.get("color"),
+            "title_bold": title_style.get("bold", True),
+            "title_alignment": _ALIGNMENTS.get(title_style.get("alignment", "left"), Alignment.LEFT),
+        }
         
         # Auto-create header section if none specified and logo is requested
-        if not has_header and include_logo:
-            title_field_path = "Number"
-            subtitle_field_path = "Subject"
-            
-            for f in schema.fields:
-                if f.category.value == "identity":
-                    if f.path.lower() in ["number", "id", "reference"]:
-                        title_field_path = f.path
-                    elif f.path.lower() in ["subject", "name", "title", "description"]:
-                        subtitle_field_path = f.path
-            
-            auto_header = HeaderConfig(
-                title_template=f"{{{title_field_path}}}",
-                subtitle_template=f"{{{subtitle_field_path}}}",
-                fields=[],
-                show_logo=True,
-                static_title=static_title,
-                title_font=title_style.get("font"),
-                title_size=title_style.get("size"),
-                title_color=title_style.get("color"),
-                title_bold=title_style.get("bold", True),
-                title_alignment=title_alignment,
-            )
-            built_sections.append(Section(
-                type=SectionType.HEADER, order=0, header_config=auto_header
+        if auto_header:
+            title_field_path, subtitle_field_path = _get_header_defaults(entity_key, schema)
+            built_sections.append(Section.model_construct(
+                type=SectionType.HEADER, order=0,
+                header_config=_make_header_config(title_field_path, subtitle_field_path, [], header_style),
             ))
         
-        for idx, spec in enumerate(sections_spec):
-            sec_type = SectionType(spec.get("type", "detail"))
-            title = spec.get("title", "")
-            fields = spec.get("fields", [])
-            formatting = spec.get("formatting", {})
-            section_order = idx + 1 if (not has_header and include_logo) else idx
-            
-            if sec_type == SectionType.HEADER:
-                field_defs = [resolve_field(f) for f in fields]
-                title_field = field_defs[0] if field_defs else None
-                
-                config = HeaderConfig(
-                    title_template=f"{{{title_field.path}}}" if title_field else "{Number}",
-                    subtitle_template=f"{{{field_defs[1].path}}}" if len(field_defs) > 1 else None,
-                    fields=field_defs[2:] if len(field_defs) > 2 else [],
-                    show_logo=include_logo,
-                    static_title=static_title,
-                    title_font=title_style.get("font"),
-                    title_size=title_style.get("size"),
-                    title_color=title_style.get("color"),
-                    title_bold=title_style.get("bold", True),
-                    title_alignment=title_alignment,
-                )
-                built_sections.append(Section(
-                    type=SectionType.HEADER, order=section_order, header_config=config
-                ))
-                
-            elif sec_type == SectionType.DETAIL:
-                field_defs = [resolve_field(f) for f in fields]
-                bold_fields = [bf.lower() for bf in formatting.get("bold_fields", [])]
-                for fd in field_defs:
-                    if fd.path.lower() in bold_fields or fd.label.lower() in bold_fields:
-                        fd.emphasis = "bold"
-                
-                config = DetailConfig(
-                    fields=field_defs,
-                    columns=formatting.get("columns", 2),
-                )
-                built_sections.append(Section(
-                    type=SectionType.DETAIL, title=title, order=section_order, detail_config=config
-                ))
-                
-            elif sec_type == SectionType.TABLE:
-                source = spec.get("source", fields[0] if fields else "Items")
-                columns = [TableColumn(field=resolve_field(f)) for f in fields]
-                config = TableConfig(source=source, columns=columns, show_header=True)
-                built_sections.append(Section(
-                    type=SectionType.TABLE, title=title, order=section_order, table_config=config
-                ))
-                
-            elif sec_type == SectionType.TEXT:
-                content = spec.get("content", "")
-                if not content and fields:
-                    content = "\n\n".join(f"{{{f}}}" for f in fields)
-                config = TextConfig(content=content)
-                built_sections.append(Section(
-                    type=SectionType.TEXT, title=title, order=section_order, text_config=config
-                ))
-                
-            elif sec_type == SectionType.LIST:
-                list_type = spec.get("list_type", "bullet")
-                items = spec.get("items", fields)
-                config = ListConfig(list_type=list_type, items=items)
-                built_sections.append(Section(
-                    type=SectionType.LIST, title=title, order=section_order, list_config=config
-                ))
+        # The auto header takes order 0, shifting the requested sections by one
+        offset = 1 if auto_header else 0
+        built_sections.extend(
+            builder(spec, idx + offset, resolve_field, header_style)
+            for idx, spec in enumerate(sections_spec)
+            if (builder := _SECTION_BUILDERS.get(SectionType(spec.get("type", "detail")))) is not None
+        )
         
         # Parse page header/footer configs
         page_header_config = None
         if page_header_json:
             try:
-                ph_data = json.loads(page_header_json)
+                ph_data = orjson.loads(page_header_json)
                 page_header_config = PageHeaderFooterConfig(**ph_data)
-            except:
+            except (orjson.JSONDecodeError, TypeError, ValueError):
                 pass
         
         page_footer_config = None
         if page_footer_json:
             try:
-                pf_data = json.loads(page_footer_json)
+                pf_data = orjson.loads(page_footer_json)
                 page_footer_config = PageHeaderFooterConfig(**pf_data)
-            except:
+            except (orjson.JSONDecodeError, TypeError, ValueError):
                 pass
         
         # Create template
-        template_id = f"pv-{uuid.uuid4().hex[:8]}"
+        template_id = f"pv-{token_hex(4)}"
         template = PortableViewTemplate(
             id=template_id,
             name=name,
@@ -769,30 +1394,10 @@ def build_custom_template(
         )
         
         # Save to disk
-        TEMPLATES_DIR.mkdir(parents=True, exist_ok=True)
         json_path = TEMPLATES_DIR / f"{template_id}.json"
-        json_path.write_text(template.model_dump_json(indent=2))
+        _save_template(template_id, json_path, template)
         
-        _active_templates[template_id] = template.model_dump()
-        
-        # Build summary
-        sections_summary = []
-        for s in built_sections:
-            cfg = s.get_config()
-            field_count = 0
-            field_names = []
-            if hasattr(cfg, 'fields'):
-                field_count = len(cfg.fields)
-                field_names = [f.label for f in cfg.fields[:5]]
-            elif hasattr(cfg, 'columns'):
-                field_count = len(cfg.columns)
-                field_names = [c.field.label for c in cfg.columns[:5]]
-            sections_summary.append({
-                "type": s.type.value,
-                "title": s.title or "(no title)",
-                "field_count": field_count,
-                "fields": field_names,
-            })
+        sections_summary = [_section_summary(s, "(no title)") for s in built_sections]
         
         return {
             "status": "ok",
@@ -805,8 +1410,74 @@ def build_custom_template(
             "message": f"Template created. Call render_smart_template('{template_id}') to generate DOCX.",
         }
     except Exception as e:
-        import traceback
-        return {"status": "error", "message": str(e), "trace": traceback.format_exc()}
+        return _tool_error(e)
+
+
+def _detail_config_at(template, config: dict):
+    """Detail config of the section at config["section_index"] (default 0), if any."""
+    sec_idx = config.get("section_index", 0)
+    if 0 <= sec_idx < len(template.sections):
+        return template.sections[sec_idx].detail_config
+    return None
+
+
+def _op_toggle_logo(template, config: dict) -> None:
+    for section in template.sections:
+        if section.type == SectionType.HEADER and section.header_config:
+            section.header_config.show_logo = config.get("show", True)
+
+
+def _op_add_fields(template, config: dict) -> None:
+    detail = _detail_config_at(template, config)
+    if detail:
+        detail.fields.extend(
+            FieldDef(path=f, label=f.replace("_", " ").title()) for f in config.get("fields", [])
+        )
+
+
+def _op_remove_fields(template, config: dict) -> None:
+    detail = _detail_config_at(template, config)
+    if detail:
+        remove_fields = frozenset(f.lower() for f in config.get("fields", []))
+        detail.fields = [
+            f for f in detail.fields
+            if f.path.lower() not in remove_fields and (f.label or "").lower() not in remove_fields
+        ]
+
+
+def _op_remove_section(template, config: dict) -> None:
+    sec_idx = config.get("section_index", 0)
+    if 0 <= sec_idx < len(template.sections):
+        template.sections.pop(sec_idx)
+        # Only sections after the removed one shift
+        for i in range(sec_idx, len(template.sections)):
+            template.sections[i].order = i
+
+
+def _op_set_bold(template, config: dict) -> None:
+    bold_fields = frozenset(f.lower() for f in config.get("fields", []))
+    for section in template.sections:
+        if section.detail_config:
+            for field in section.detail_config.fields:
+                if field.path.lower() in bold_fields or (field.label or "").lower() in bold_fields:
+                    field.emphasis = "bold"
+
+
+def _op_set_columns(template, config: dict) -> None:
+    detail = _detail_config_at(template, config)
+    if detail:
+        detail.columns = config.get("columns", 2)
+
+
+# modify_existing_template operation name -> in-place edit of the loaded template
+_TEMPLATE_OPERATIONS = {
+    "add_fields": _op_add_fields,
+    "remove_fields": _op_remove_fields,
+    "remove_section": _op_remove_section,
+    "toggle_logo": _op_toggle_logo,
+    "set_bold": _op_set_bold,
+    "set_columns": _op_set_columns,
+}
 
 
 @tool
@@ -816,111 +1487,36 @@ def modify_existing_template(
     config_json: str = None
 ) -> dict:
     """
-    Modify an existing template based on user feedback.
-    
-    Use this when user asks to change something about a template:
-    - "remove the logo"
-    - "make the subject bold"
-    - "add the Due Date field"
+    Modify an existing template (see TOOL REFERENCE for operations).
     
     Args:
         template_id: The template to modify
-        operation: One of:
-            - "add_fields" - Add fields to a section
-            - "remove_fields" - Remove fields from a section
-            - "add_section" - Add a new section
-            - "remove_section" - Remove a section
-            - "toggle_logo" - Turn logo on/off
-            - "set_bold" - Make specific fields bold
-            - "set_columns" - Change column count in a section
+        operation: add_fields | remove_fields | remove_section | toggle_logo | set_bold | set_columns
         config_json: JSON config for the operation
-    
-    Returns:
-        Dict with updated template structure
     """
     try:
-        from report_genius.templates import (
-            PortableViewTemplate, Section, SectionType,
-            HeaderConfig, DetailConfig, FieldDef, FieldFormat as TGFieldFormat,
-        )
-        from report_genius.config import TEMPLATES_DIR
-        
-        json_path = TEMPLATES_DIR / f"{template_id}.json"
+        json_path = saved_template_path(template_id)
         
         if not json_path.exists():
             return {"status": "error", "message": f"Template {template_id} not found"}
         
-        template = PortableViewTemplate.model_validate_json(json_path.read_text())
-        config = json.loads(config_json) if config_json else {}
-        
-        if operation == "toggle_logo":
-            for section in template.sections:
-                if section.type == SectionType.HEADER and section.header_config:
-                    section.header_config.show_logo = config.get("show", True)
-                    
-        elif operation == "add_fields":
-            sec_idx = config.get("section_index", 0)
-            new_fields = config.get("fields", [])
-            if 0 <= sec_idx < len(template.sections):
-                section = template.sections[sec_idx]
-                if section.detail_config:
-                    for f in new_fields:
-                        section.detail_config.fields.append(
-                            FieldDef(path=f, label=f.replace("_", " ").title())
-                        )
-                        
-        elif operation == "remove_fields":
-            sec_idx = config.get("section_index", 0)
-            remove_fields = [f.lower() for f in config.get("fields", [])]
-            if 0 <= sec_idx < len(template.sections):
-                section = template.sections[sec_idx]
-                if section.detail_config:
-                    section.detail_config.fields = [
-                        f for f in section.detail_config.fields
-                        if f.path.lower() not in remove_fields and f.label.lower() not in remove_fields
-                    ]
-                    
-        elif operation == "remove_section":
-            sec_idx = config.get("section_index", 0)
-            if 0 <= sec_idx < len(template.sections):
-                template.sections.pop(sec_idx)
-                for i, s in enumerate(template.sections):
-                    s.order = i
-                    
-        elif operation == "set_bold":
-            bold_fields = [f.lower() for f in config.get("fields", [])]
-            for section in template.sections:
-                if section.detail_config:
-                    for field in section.detail_config.fields:
-                        if field.path.lower() in bold_fields or field.label.lower() in bold_fields:
-                            field.emphasis = "bold"
-                            
-        elif operation == "set_columns":
-            sec_idx = config.get("section_index", 0)
-            columns = config.get("columns", 2)
-            if 0 <= sec_idx < len(template.sections):
-                section = template.sections[sec_idx]
-                if section.detail_config:
-                    section.detail_config.columns = columns
+        apply = _TEMPLATE_OPERATIONS.get(operation)
+        if apply is None:
+            return {"status": "error", "message": f"Unknown operation: {operation}",
+                    "available": list(_TEMPLATE_OPERATIONS)}
+        
+        # Edit a deep copy: the cached object is shared with concurrent readers, and a
+        # failed operation must not leave it half-modified. The saved result is cached
+        # once written.
+        template = _load_template_cached(template_id, json_path).model_copy(deep=True)
+        config = orjson.loads(config_json) if config_json else {}
+        
+        apply(template, config)
         
         # Save updated template
-        json_path.write_text(template.model_dump_json(indent=2))
-        _active_templates[template_id] = template.model_dump()
+        _save_template(template_id, json_path, template)
         
-        # Build summary
-        sections_summary = []
-        for s in template.sections:
-            cfg = s.get_config()
-            field_names = []
-            if hasattr(cfg, 'fields'):
-                field_names = [f.label for f in cfg.fields[:5]]
-            elif hasattr(cfg, 'columns'):
-                field_names = [c.field.label for c in cfg.columns[:5]]
-            sections_summary.append({
-                "type": s.type.value,
-                "title": s.title or "(header)",
-                "fields": field_names,
-            })
+        sections_summary = [_section_summary(s) for s in template.sections]
         
         return {
             "status": "ok",
@@ -930,31 +1526,19 @@ def modify_existing_template(
             "message": f"Template updated. Call render_smart_template('{template_id}') to generate DOCX.",
         }
     except Exception as e:
-        import traceback
-        return {"status": "error", "message": str(e), "trace": traceback.format_exc()}
+        return _tool_error(e)
 
 
 @tool  
 def preview_template_structure(template_id: str) -> dict:
-    """
-    Show the current structure of a template so user can see what will be generated.
-    
-    Args:
-        template_id: Template to preview
-        
-    Returns:
-        Dict with detailed template structure including all sections and fields
-    """
+    """Show the current structure (sections and fields) of a template."""
     try:
-        from report_genius.templates import PortableViewTemplate
-        from report_genius.config import TEMPLATES_DIR
-        
-        json_path = TEMPLATES_DIR / f"{template_id}.json"
+        json_path = saved_template_path(template_id)
         
         if not json_path.exists():
             return {"status": "error", "message": f"Template {template_id} not found"}
         
-        template = PortableViewTemplate.model_validate_json(json_path.read_text())
+        template = _load_template_cached(template_id, json_path)
         
         sections_detail = []
         for s in template.sections:
@@ -965,17 +1549,18 @@ def preview_template_structure(template_id: str) -> dict:
                 "order": s.order,
             }
             
-            if hasattr(cfg, 'show_logo'):
+            has_fields, is_table, has_layout, has_logo = _config_shape(cfg)
+            if has_logo:
                 detail["show_logo"] = cfg.show_logo
-            if hasattr(cfg, 'fields'):
+            if has_fields:
                 detail["fields"] = [
                     {"path": f.path, "label": f.label, "format": f.format.value if f.format else "text", 
-                     "bold": getattr(f, 'emphasis', None) == 'bold'}
+                     "bold": f.emphasis == "bold"}
                     for f in cfg.fields
                 ]
-            if hasattr(cfg, 'columns') and isinstance(cfg.columns, int):
+            if has_layout:
                 detail["column_layout"] = cfg.columns
-            if hasattr(cfg, 'columns') and isinstance(cfg.columns, list):
+            if is_table:
                 detail["table_columns"] = [
                     {"path": c.field.path, "label": c.field.label}
                     for c in cfg.columns
@@ -992,7 +1577,7 @@ def preview_template_structure(template_id: str) -> dict:
             "layout_columns": template.layout.columns if template.layout else 1,
         }
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
 
 
 # ============== Collect SOTA Template tools ==============
@@ -1011,41 +1596,106 @@ SOTA_TEMPLATE_TOOLS = [
 
 # ============== DOCX Token Injection Tools ==============
 
+UPLOADS_DIR = PROJECT_ROOT / "uploads"
+UPLOADS_DIR.mkdir(exist_ok=True)
+
+
+# DOCX analyses keyed by (content digest, entity_def, mapping size): analyze, then inject
+# on the same upload reuses the parse. Content-keyed, so a re-uploaded file is analyzed
+# afresh; labels matched against LABEL_NORMALIZATIONS, so plans made before schema labels
+# were added to it are not reused.
+ANALYSIS_CACHE_SIZE = 32
+_analysis_plans: "OrderedDict[Tuple[bytes, str, int], Any]" = OrderedDict()
+_analysis_plans_lock = threading.Lock()
+
+
+def _analysis_plan(doc_bytes: bytes, entity_def: str):
+    """analyze_document() for these bytes, reusing a recent result for identical content."""
+    key = (hashlib.sha1(doc_bytes).digest(), entity_def or "", len(LABEL_NORMALIZATIONS))
+    with _analysis_plans_lock:
+        plan = _analysis_plans.get(key)
+        if plan is not None:
+            _analysis_plans.move_to_end(key)
+            return plan
+    plan = analyze_document(doc_bytes, entity_def)
+    with _analysis_plans_lock:
+        _analysis_plans[key] = plan
+        while len(_analysis_plans) > ANALYSIS_CACHE_SIZE:
+            _analysis_plans.popitem(last=False)
+    return plan
+
+
+def _injection_key(doc_bytes: bytes, entity_def: str, add_logo: bool, add_timestamp: bool) -> str:
+    """Content key for a token injection run: source bytes plus every option that changes the output."""
+    digest = hashlib.blake2b(doc_bytes, digest_size=16)
+    digest.update(entity_def.encode())
+    digest.update(bytes([add_logo, add_timestamp]))
+    return digest.hexdigest()
+
+
+def _cached_injection(sidecar: Path, key: str, output: Path) -> Optional[dict]:
+    """Stored response for a previous identical injection, if its output is still published."""
+    try:
+        data = orjson.loads(sidecar.read_bytes())
+    except (OSError, orjson.JSONDecodeError):
+        return None
+    if data.get("key") != key or not output.exists():
+        return None
+    return data["response"]
+
+
+def _publish_bytes(data: bytes, path: Path, mirror: Optional[Path] = None) -> None:
+    """
+    Atomically write data to path and optionally to a second location.
+    
+    Each destination is written through its own uniquely named temp file and os.replace'd
+    into place, so readers never see a partial document and concurrent publishes of the
+    same name don't collide. The mirror is an independent copy: the server rewrites
+    upload paths in place, which would also rewrite a hard-linked download.
+    
+    Args:
+        data: File contents
+        path: Primary destination
+        mirror: Optional second destination (e.g. the reports download directory)
+    """
+    _atomic_write(path, data)
+    if mirror is not None:
+        _atomic_write(mirror, data)
+
+
 def _get_uploads_dir() -> Path:
     """Get uploads directory."""
-    uploads = Path(__file__).parent.parent.parent.parent / "uploads"
-    uploads.mkdir(exist_ok=True)
-    return uploads
+    return UPLOADS_DIR
+
+
+def _read_upload(filename: str) -> Optional[bytes]:
+    """Read an uploaded file's bytes, or None if it does not exist (one open, no stat)."""
+    try:
+        return (_get_uploads_dir() / filename).read_bytes()
+    except (FileNotFoundError, IsADirectoryError):
+        return None
 
 
 @tool
 def analyze_uploaded_template(filename: str, entity_def: str = "") -> dict:
     """
-    Analyze an uploaded DOCX template and detect placeholder patterns.
-    
-    This tool examines a Word document that may have "blank" template patterns like:
-    - "ID: " (label with trailing whitespace)
-    - "Status: ______" (label with underscores)
+    Analyze an uploaded DOCX template and detect blank placeholder patterns.
     
     Args:
         filename: The uploaded file name (in uploads/ directory)
         entity_def: Target Kahua entity (e.g., "kahua_AEC_RFI.RFI") for better field mapping
-        
-    Returns:
-        Dict with detected placeholders and suggestions
     """
     try:
-        from report_genius.injection import analyze_and_inject
-        
-        file_path = _get_uploads_dir() / filename
-        if not file_path.exists():
-            return {"status": "error", "message": f"File not found: {filename}"}
-        
         if not filename.lower().endswith(('.docx', '.doc')):
             return {"status": "error", "message": "Only Word documents (.docx) are supported"}
         
-        doc_bytes = file_path.read_bytes()
-        result = analyze_and_inject(doc_bytes, entity_def=entity_def, auto_inject=False)
+        doc_bytes = _read_upload(filename)
+        if doc_bytes is None:
+            return {"status": "error", "message": f"File not found: {filename}"}
+        
+        result = analyze_and_inject(
+            doc_bytes, entity_def=entity_def, auto_inject=False, plan=_analysis_plan(doc_bytes, entity_def)
+        )
         
         return {
             "status": "ok",
@@ -1054,7 +1704,7 @@ def analyze_uploaded_template(filename: str, entity_def: str = "") -> dict:
             "analysis": result['analysis']
         }
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
 
 
 @tool
@@ -1066,9 +1716,7 @@ def inject_tokens_into_template(
     allow_low_confidence: bool = False,
 ) -> dict:
     """
-    Inject Kahua tokens into an uploaded template based on detected patterns.
-    
-    Should be called AFTER analyze_uploaded_template.
+    Inject Kahua tokens into an uploaded template. Call AFTER analyze_uploaded_template.
     
     Args:
         filename: The uploaded file name to modify
@@ -1076,19 +1724,14 @@ def inject_tokens_into_template(
         add_logo: Add [CompanyLogo(...)] placeholder to header
         add_timestamp: Add [ReportModifiedTimeStamp] to footer
         allow_low_confidence: Proceed even if low-confidence mappings are detected
-        
-    Returns:
-        Dict with modified filename and download URL
     """
     try:
-        from report_genius.injection import analyze_and_inject, add_logo_placeholder, add_timestamp_token
-        
-        file_path = _get_uploads_dir() / filename
-        if not file_path.exists():
+        doc_bytes = _read_upload(filename)
+        if doc_bytes is None:
             return {"status": "error", "message": f"File not found: {filename}"}
         
-        doc_bytes = file_path.read_bytes()
-        analysis = analyze_and_inject(doc_bytes, entity_def=entity_def, auto_inject=False)
+        plan = _analysis_plan(doc_bytes, entity_def)
+        analysis = analyze_and_inject(doc_bytes, entity_def=entity_def, auto_inject=False, plan=plan)
         low_confidence = _low_confidence_labels(analysis["analysis"]["placeholders"])
         if low_confidence and not allow_low_confidence:
             return {
@@ -1098,7 +1741,15 @@ def inject_tokens_into_template(
                 "analysis": analysis["analysis"],
             }
 
-        result = analyze_and_inject(doc_bytes, entity_def=entity_def, auto_inject=True)
+        # Same source bytes and options as the last run: the published output is still valid
+        modified_filename = f"tokenized_{filename}"
+        sidecar = _get_uploads_dir() / f".{modified_filename}.json"
+        key = _injection_key(doc_bytes, entity_def, add_logo, add_timestamp)
+        cached = _cached_injection(sidecar, key, REPORTS_DIR / modified_filename)
+        if cached is not None:
+            return cached
+        
+        result = analyze_and_inject(doc_bytes, entity_def=entity_def, auto_inject=True, plan=plan)
         
         if not result.get('injection', {}).get('success'):
             return {
@@ -1118,86 +1769,81 @@ def inject_tokens_into_template(
             aesthetics_added.append("timestamp")
         
         # Save modified document
-        modified_filename = f"tokenized_{filename}"
         modified_path = _get_uploads_dir() / modified_filename
-        modified_path.write_bytes(modified_doc)
-        
-        # Also copy to reports for download
-        from report_genius.config import REPORTS_DIR
-        REPORTS_DIR.mkdir(exist_ok=True)
-        (REPORTS_DIR / modified_filename).write_bytes(modified_doc)
-        
-        base_url = os.getenv("REPORT_BASE_URL", "http://localhost:8000")
+        _publish_bytes(modified_doc, modified_path, REPORTS_DIR / modified_filename)
         
-        return {
+        response = {
             "status": "ok",
             "original_filename": filename,
             "modified_filename": modified_filename,
-            "download_url": f"{base_url}/reports/{modified_filename}",
+            "download_url": f"{REPORT_BASE_URL}/reports/{modified_filename}",
             "tokens_injected": result['injection']['tokens_injected'],
             "changes": result['injection']['changes_made'],
             "aesthetics_added": aesthetics_added,
         }
+        sidecar.write_bytes(orjson.dumps({"key": key, "response": response}))
+        return response
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
+
+
+# Guide categories in priority order: a label goes to the first category any keyword hits
+_GUIDE_CATEGORIES = (
+    ("identity_fields", ('id', 'number', 'name', 'subject', 'title', 'ref')),
+    ("date_fields", ('date', 'due', 'start', 'end', 'created', 'modified')),
+    ("contact_fields", ('from', 'to', 'by', 'author', 'contact', 'company')),
+    ("financial_fields", ('amount', 'cost', 'price', 'total', 'value')),
+    ("text_fields", ('description', 'notes', 'scope', 'question', 'answer')),
+    ("status_fields", ('status', 'state', 'priority', 'phase')),
+)
+_GUIDE_KEYWORD_RANK = {
+    kw: rank for rank, (_, keywords) in reversed(list(enumerate(_GUIDE_CATEGORIES))) for kw in keywords
+}
+# One pass over the label: the lookahead reports a match at every position, and the
+# alternation is ordered by category so each position yields its highest-priority keyword
+_GUIDE_KEYWORD_RE = re.compile(
+    "(?=(" + "|".join(re.escape(kw) for _, keywords in _GUIDE_CATEGORIES for kw in keywords) + "))"
+)
+
+
+def _guide_category(label: str) -> str:
+    """Return the mapping-guide category for a normalized label."""
+    rank = min((_GUIDE_KEYWORD_RANK[m.group(1)] for m in _GUIDE_KEYWORD_RE.finditer(label)), default=None)
+    return "other_fields" if rank is None else _GUIDE_CATEGORIES[rank][0]
+
+
+def _build_token_guide() -> Dict[str, Any]:
+    """Categorize LABEL_NORMALIZATIONS for the mapping guide."""
+    mappings: Dict[str, Dict[str, str]] = {name: {} for name, _ in _GUIDE_CATEGORIES}
+    mappings["other_fields"] = {}
+    for label, path in LABEL_NORMALIZATIONS.items():
+        mappings[_guide_category(label)][label] = path
+    
+    return {
+        "mappings": mappings,
+        "token_formats": {
+            "text": "[Attribute(FieldPath)]",
+            "date": "[Date(Source=Attribute,Path=FieldPath,Format=\"d\")]",
+            "currency": "[Currency(Source=Attribute,Path=FieldPath,Format=\"C2\")]",
+        },
+    }
+
+
+# Schema-driven injection adds labels to LABEL_NORMALIZATIONS at runtime (it never removes
+# or overwrites them), so the guide is rebuilt whenever the mapping has grown
+_token_guide: Tuple[int, Dict[str, Any]] = (-1, {})
 
 
 @tool
 def show_token_mapping_guide() -> dict:
-    """
-    Show the label-to-token mapping guide.
-    
-    Returns the mapping rules used to convert labels like "ID:" to Kahua paths.
-    
-    Returns:
-        Dict with common label mappings organized by category
-    """
-    try:
-        from report_genius.injection import LABEL_NORMALIZATIONS
-        
-        identity = {}
-        dates = {}
-        contacts = {}
-        financial = {}
-        text = {}
-        status = {}
-        other = {}
-        
-        for label, path in LABEL_NORMALIZATIONS.items():
-            if any(x in label for x in ['id', 'number', 'name', 'subject', 'title', 'ref']):
-                identity[label] = path
-            elif any(x in label for x in ['date', 'due', 'start', 'end', 'created', 'modified']):
-                dates[label] = path
-            elif any(x in label for x in ['from', 'to', 'by', 'author', 'contact', 'company']):
-                contacts[label] = path
-            elif any(x in label for x in ['amount', 'cost', 'price', 'total', 'value']):
-                financial[label] = path
-            elif any(x in label for x in ['description', 'notes', 'scope', 'question', 'answer']):
-                text[label] = path
-            elif any(x in label for x in ['status', 'state', 'priority', 'phase']):
-                status[label] = path
-            else:
-                other[label] = path
-        
-        return {
-            "status": "ok",
-            "mappings": {
-                "identity_fields": identity,
-                "date_fields": dates,
-                "contact_fields": contacts,
-                "financial_fields": financial,
-                "text_fields": text,
-                "status_fields": status,
-                "other_fields": other
-            },
-            "token_formats": {
-                "text": "[Attribute(FieldPath)]",
-                "date": "[Date(Source=Attribute,Path=FieldPath,Format=\"d\")]",
-                "currency": "[Currency(Source=Attribute,Path=FieldPath,Format=\"C2\")]",
-            },
-        }
-    except Exception as e:
-        return {"status": "error", "message": str(e)}
+    """Show the label-to-token mapping guide (e.g. "ID:" -> Kahua path), by category."""
+    global _token_guide
+    size, guide = _token_guide
+    if size != len(LABEL_NORMALIZATIONS):
+        size = len(LABEL_NORMALIZATIONS)
+        guide = _build_token_guide()
+        _token_guide = (size, guide)
+    return {"status": "ok", **guide}
 
 
 # ============== Collect DOCX Injection tools ==============
@@ -1218,28 +1864,18 @@ def process_attached_docx(
     filename: str = "attached_template.docx"
 ) -> dict:
     """
-    Process a DOCX file attached directly in chat.
-    
-    Use this when a user attaches a Word document in the chat - you'll receive
-    the file content as base64. This tool analyzes it for placeholder patterns
-    and suggests Kahua tokens.
+    Analyze a DOCX attached directly in chat (base64) and save it for follow-up actions.
     
     Args:
-        docx_base64: Base64-encoded DOCX file content (from chat attachment)
+        docx_base64: Base64-encoded DOCX file content
         entity_def: Target entity (e.g., "RFI", "Invoice", "kahua_AEC_RFI.RFI")
         filename: Original filename for reference
-        
-    Returns:
-        Dict with analysis results and filename for follow-up actions
     """
-    import base64
     try:
-        from report_genius.injection import analyze_and_inject
-        
         # Decode base64 content
         try:
             doc_bytes = base64.b64decode(docx_base64)
-        except Exception:
+        except (ValueError, TypeError):
             return {"status": "error", "message": "Invalid base64 content. Ensure the file is properly encoded."}
         
         # Validate it's a valid DOCX (should start with PK zip header)
@@ -1256,7 +1892,10 @@ def process_attached_docx(
         resolved_entity = resolve_entity_def(entity_def) if entity_def else ""
         
         # Analyze the document
-        result = analyze_and_inject(doc_bytes, entity_def=resolved_entity, auto_inject=False)
+        result = analyze_and_inject(
+            doc_bytes, entity_def=resolved_entity, auto_inject=False,
+            plan=_analysis_plan(doc_bytes, resolved_entity),
+        )
         
         return {
             "status": "ok",
@@ -1270,7 +1909,7 @@ def process_attached_docx(
             ]
         }
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
 
 
 @tool
@@ -1281,36 +1920,21 @@ def complete_attached_template(
     filename: str = "attached_template.docx"
 ) -> dict:
     """
-    Complete an attached DOCX template with Kahua tokens and modern features.
-    
-    This is the full agentic completion tool for chat attachments. It:
-    1. Decodes and saves the attached DOCX
-    2. Analyzes semantic structure (sections, lists, tables)
-    3. Creates a complete PortableViewTemplate with all features
-    4. Saves and returns the template ID for rendering
-    
-    Use this when a user attaches a Word document and wants it fully converted
-    to a Kahua-ready template with page headers/footers, lists, etc.
+    Convert a DOCX attached in chat (base64) into a complete PortableViewTemplate.
     
     Args:
-        docx_base64: Base64-encoded DOCX file content (from chat attachment)
+        docx_base64: Base64-encoded DOCX file content
         entity_def: Target entity (e.g., "RFI", "Invoice")
         template_name: Name for the generated template
         filename: Original filename for reference
-        
-    Returns:
-        Dict with template_id ready for render_completed_template()
     """
-    import base64
     try:
         from agentic_template_analyzer import analyze_and_convert
-        from report_genius.templates import PortableViewTemplate
-        from report_genius.config import TEMPLATES_DIR
         
         # Decode base64 content
         try:
             doc_bytes = base64.b64decode(docx_base64)
-        except Exception:
+        except (ValueError, TypeError):
             return {"status": "error", "message": "Invalid base64 content"}
         
         if not doc_bytes.startswith(b'PK'):
@@ -1329,11 +1953,9 @@ def complete_attached_template(
         result = analyze_and_convert(doc_bytes, resolved_entity, template_name)
         
         if result.get('status') == 'ok':
-            TEMPLATES_DIR.mkdir(parents=True, exist_ok=True)
-            
-            template = PortableViewTemplate.model_validate(result['template'])
+            template = _template_from_dict(result['template'])
             json_path = TEMPLATES_DIR / f"{template.id}.json"
-            json_path.write_text(template.model_dump_json(indent=2))
+            _save_template(template.id, json_path, template)
             
             result['saved_to'] = str(json_path)
             result['original_file'] = saved_filename
@@ -1341,7 +1963,7 @@ def complete_attached_template(
         
         return result
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
 
 
 DIRECT_DOCX_TOOLS = [
@@ -1359,46 +1981,33 @@ def analyze_and_complete_template(
     template_name: str = "Imported Template"
 ) -> dict:
     """
-    Analyze an uploaded DOCX and create a complete PortableViewTemplate.
-    
-    This is the AGENTIC template completion tool. It:
-    1. Parses the document's semantic structure
-    2. Detects blank/placeholder patterns and maps them to Kahua fields
-    3. Generates a complete PortableViewTemplate
+    Convert an uploaded DOCX into a complete PortableViewTemplate.
     
     Args:
         filename: Name of uploaded file (in uploads/ directory)
         entity_def: Kahua entity definition (e.g., "kahua_AEC_RFI.RFI")
         template_name: Name for the generated template
-        
-    Returns:
-        Dict with analysis, template_id, and sections_summary
     """
     try:
         from agentic_template_analyzer import analyze_and_convert
-        from report_genius.templates import PortableViewTemplate
-        from report_genius.config import TEMPLATES_DIR
         
-        file_path = _get_uploads_dir() / filename
-        if not file_path.exists():
+        doc_bytes = _read_upload(filename)
+        if doc_bytes is None:
             return {"status": "error", "message": f"File not found: {filename}"}
         
-        doc_bytes = file_path.read_bytes()
         result = analyze_and_convert(doc_bytes, entity_def, template_name)
         
         if result.get('status') == 'ok':
-            TEMPLATES_DIR.mkdir(parents=True, exist_ok=True)
-            
-            template = PortableViewTemplate.model_validate(result['template'])
+            template = _template_from_dict(result['template'])
             json_path = TEMPLATES_DIR / f"{template.id}.json"
-            json_path.write_text(template.model_dump_json(indent=2))
+            _save_template(template.id, json_path, template)
             
             result['saved_to'] = str(json_path)
             result['message'] = f"Template '{template_name}' created with {len(template.sections)} sections"
         
         return result
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
 
 
 @tool
@@ -1409,28 +2018,26 @@ def render_completed_template(
     add_page_footer: bool = True
 ) -> dict:
     """
-    Render a completed template to DOCX with full features.
+    Render a completed template to DOCX with page header/footer.
     
     Args:
         template_id: ID from analyze_and_complete_template
         output_name: Optional custom filename
         add_page_header: Include page header if not already present
         add_page_footer: Include page footer with page numbers
-        
-    Returns:
-        Dict with download URL for the rendered document
     """
+    if DocxRenderer is None:
+        return {"status": "error", "message": "DOCX renderer not available (template_gen not importable)"}
     try:
-        from report_genius.templates import PortableViewTemplate, PageHeaderFooterConfig
-        from report_genius.rendering import DocxRenderer
-        from report_genius.config import TEMPLATES_DIR, REPORTS_DIR
-        
-        json_path = TEMPLATES_DIR / f"{template_id}.json"
+        json_path = saved_template_path(template_id)
         
         if not json_path.exists():
             return {"status": "error", "message": f"Template {template_id} not found"}
         
-        template = PortableViewTemplate.model_validate_json(json_path.read_text())
+        # The page header/footer defaults below apply to this render only, so copy the
+        # cached template and its layout rather than re-reading the file
+        template = _load_template_cached(template_id, json_path)
+        template = template.model_copy(update={"layout": template.layout.model_copy()})
         
         if add_page_header and not template.layout.page_header:
             template.layout.page_header = PageHeaderFooterConfig(
@@ -1448,23 +2055,19 @@ def render_completed_template(
         renderer = DocxRenderer(template)
         doc_bytes = renderer.render_to_bytes()
         
-        REPORTS_DIR.mkdir(exist_ok=True)
-        
         filename = output_name or template_id
         docx_path = REPORTS_DIR / f"{filename}.docx"
-        docx_path.write_bytes(doc_bytes)
-        
-        base_url = os.getenv("REPORT_BASE_URL", "http://localhost:8000")
+        _publish_bytes(doc_bytes, docx_path)
         
         return {
             "status": "ok",
             "filename": docx_path.name,
-            "download_url": f"{base_url}/reports/{docx_path.name}",
+            "download_url": f"{REPORT_BASE_URL}/reports/{docx_path.name}",
             "template_name": template.name,
             "sections_rendered": len(template.sections),
         }
     except Exception as e:
-        return {"status": "error", "message": str(e)}
+        return _tool_error(e)
 
 
 # ============== Collect Agentic Template tools ==============
@@ -1477,124 +2080,106 @@ AGENTIC_TEMPLATE_TOOLS = [
 
 # ============== Legacy Template Tools (Optional) ==============
 
+# Resolved once; the loaders below import directly so real import errors surface
+_HAS_PV = importlib.util.find_spec("pv_md_renderer") is not None
+_HAS_TG = importlib.util.find_spec("pv_template_generator") is not None
+
+
+@lru_cache(maxsize=None)
 def load_legacy_pv_tools():
     """Load legacy portable view tools if available."""
-    tools = []
-    try:
-        from pv_md_renderer import preview_portable_view, finalize_portable_view, list_md_templates
-        
-        @tool
-        def preview_md_portable_view(template_id: str, entity_data_json: str) -> dict:
-            """Preview a portable view using an EXISTING template as rendered markdown."""
-            try:
-                entity_data = json.loads(entity_data_json)
-                return preview_portable_view(template_id, entity_data)
-            except Exception as e:
-                return {"status": "error", "message": str(e)}
-        
-        @tool
-        def finalize_md_portable_view(preview_id: str) -> dict:
-            """Finalize a previewed portable view and generate the DOCX."""
-            return finalize_portable_view(preview_id)
-        
-        @tool
-        def list_md_templates_tool() -> dict:
-            """List available markdown portable view templates."""
-            return list_md_templates()
-        
-        tools = [preview_md_portable_view, finalize_md_portable_view, list_md_templates_tool]
-        log.info("Legacy PV tools loaded")
-    except ImportError:
+    if not _HAS_PV:
         log.warning("Legacy PV tools not available")
+        return []
+    
+    from pv_md_renderer import preview_portable_view, finalize_portable_view, list_md_templates
+    
+    @tool
+    def preview_md_portable_view(template_id: str, entity_data_json: str) -> dict:
+        """Preview a portable view using an EXISTING template as rendered markdown."""
+        try:
+            entity_data = orjson.loads(entity_data_json)
+            return preview_portable_view(template_id, entity_data)
+        except Exception as e:
+            return _tool_error(e)
+    
+    @tool
+    def finalize_md_portable_view(preview_id: str) -> dict:
+        """Finalize a previewed portable view and generate the DOCX."""
+        return finalize_portable_view(preview_id)
+    
+    @tool
+    def list_md_templates_tool() -> dict:
+        """List available markdown portable view templates."""
+        return list_md_templates()
     
-    return tools
+    log.info("Legacy PV tools loaded")
+    return [preview_md_portable_view, finalize_md_portable_view, list_md_templates_tool]
 
 
+@lru_cache(maxsize=None)
 def load_legacy_template_gen_tools():
     """Load legacy template generation tools if available."""
-    tools = []
-    try:
-        from pv_template_generator import (
-            create_entity_template,
-            preview_template,
-            finalize_preview,
-            save_template,
-            load_template,
-            list_saved_templates,
-            update_template_markdown,
-        )
-        
-        @tool
-        def create_template_for_entity(
-            entity_def: str,
-            entity_display_name: str,
-            schema_fields_json: str,
-            style: str = "professional"
-        ) -> dict:
-            """Create a NEW reusable template for any entity type (legacy)."""
-            try:
-                schema_fields = json.loads(schema_fields_json)
-                return create_entity_template(
-                    entity_def=entity_def,
-                    entity_display_name=entity_display_name,
-                    schema_fields=schema_fields,
-                    style=style,
-                )
-            except Exception as e:
-                return {"status": "error", "message": str(e)}
-        
-        @tool
-        def preview_custom_template(
-            template_id: str,
-            template_markdown: str,
-            entity_data_json: str
-        ) -> dict:
-            """Preview a custom template with actual entity data (legacy)."""
-            try:
-                entity_data = json.loads(entity_data_json)
-                return preview_template(template_id, template_markdown, entity_data)
-            except Exception as e:
-                return {"status": "error", "message": str(e)}
-        
-        @tool
-        def finalize_custom_template(preview_id: str, output_name: str = None) -> dict:
-            """Generate DOCX from a previewed custom template (legacy)."""
-            return finalize_preview(preview_id, output_name)
-        
-        @tool
-        def save_custom_template(
-            template_id: str,
-            name: str,
-            entity_def: str,
-            markdown: str,
-            description: str = ""
-        ) -> dict:
-            """Save a custom template for future reuse (legacy)."""
-            return save_template(template_id, name, entity_def, markdown, description)
-        
-        @tool
-        def list_custom_templates(entity_def: str = None) -> dict:
-            """List saved custom templates (legacy)."""
-            return list_saved_templates(entity_def)
-        
-        @tool
-        def modify_template(template_id: str, new_markdown: str) -> dict:
-            """Update the markdown content of a template (legacy)."""
-            return update_template_markdown(template_id, new_markdown)
-        
-        tools = [
-            create_template_for_entity,
-            preview_custom_template,
-            finalize_custom_template,
-            save_custom_template,
-            list_custom_templates,
-            modify_template,
-        ]
-        log.info("Legacy template gen tools loaded")
-    except ImportError as e:
-        log.warning(f"Legacy template gen tools not available: {e}")
+    if not _HAS_TG:
+        log.warning("Legacy template gen tools not available")
+        return []
+    
+    # create_entity_template is superseded by smart_compose_template
+    from pv_template_generator import (
+        preview_template,
+        finalize_preview,
+        save_template,
+        list_saved_templates,
+        update_template_markdown,
+    )
     
-    return tools
+    @tool
+    def preview_custom_template(
+        template_id: str,
+        template_markdown: str,
+        entity_data_json: str
+    ) -> dict:
+        """Preview a custom template with actual entity data (legacy)."""
+        try:
+            entity_data = orjson.loads(entity_data_json)
+            return preview_template(template_id, template_markdown, entity_data)
+        except Exception as e:
+            return _tool_error(e)
+    
+    @tool
+    def finalize_custom_template(preview_id: str, output_name: str = None) -> dict:
+        """Generate DOCX from a previewed custom template (legacy)."""
+        return finalize_preview(preview_id, output_name)
+    
+    @tool
+    def save_custom_template(
+        template_id: str,
+        name: str,
+        entity_def: str,
+        markdown: str,
+        description: str = ""
+    ) -> dict:
+        """Save a custom template for future reuse (legacy)."""
+        return save_template(template_id, name, entity_def, markdown, description)
+    
+    @tool
+    def list_custom_templates(entity_def: str = None) -> dict:
+        """List saved custom templates (legacy)."""
+        return list_saved_templates(entity_def)
+    
+    @tool
+    def modify_template(template_id: str, new_markdown: str) -> dict:
+        """Update the markdown content of a template (legacy)."""
+        return update_template_markdown(template_id, new_markdown)
+    
+    log.info("Legacy template gen tools loaded")
+    return [
+        preview_custom_template,
+        finalize_custom_template,
+        save_custom_template,
+        list_custom_templates,
+        modify_template,
+    ]
 
 
 # ============== All Tools Aggregator ==============
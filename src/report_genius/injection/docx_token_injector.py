@@ -930,7 +930,8 @@ def analyze_and_inject(
     doc_bytes: bytes,
     entity_def: str = "",
     auto_inject: bool = False,
-    schema_fields: Optional[List[Dict[str, str]]] = None
+    schema_fields: Optional[List[Dict[str, str]]] = None,
+    plan: Optional[InjectionPlan] = None,
 ) -> Dict[str, Any]:
     """
     Analyze a document and optionally inject tokens.
@@ -940,6 +941,7 @@ def analyze_and_inject(
         entity_def: The target Kahua entity definition
         auto_inject: If True, automatically inject tokens
         schema_fields: Optional list of available schema fields for better matching
+        plan: Optional analyze_document() result for these bytes, to skip re-analysis
         
     Returns:
         Analysis results with injection plan and optionally modified document
@@ -949,7 +951,8 @@ def analyze_and_inject(
         _enhance_mappings_from_schema(schema_fields)
     
     # Analyze the document
-    plan = analyze_document(doc_bytes, entity_def)
+    if plan is None:
+        plan = analyze_document(doc_bytes, entity_def)
     
     result = {
         'analysis': {
@@ -114,6 +114,7 @@ class FieldDef(BaseModel):
     format_options: Optional[FormatOptions] = None
     alignment: Alignment = Alignment.LEFT
     transform: Optional[str] = None  # Optional: "uppercase", "sum", etc.
+    emphasis: Optional[str] = None  # Optional: "bold" to emphasize the value
 
 
 class Condition(BaseModel):
@@ -688,7 +688,7 @@ class SOTADocxRenderer:
                 link_style = styles.add_style("Hyperlink", WD_STYLE_TYPE.CHARACTER)
                 link_style.font.color.rgb = RGBColor(0, 0, 255)  # Blue
                 link_style.font.underline = True
-            except:
+            except ValueError:
                 pass  # Style may already exist as built-in
     
     def render(self) -> Document:
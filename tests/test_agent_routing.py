@@ -1,3 +1,8 @@
+from langchain_core.language_models.fake_chat_models import GenericFakeChatModel
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langgraph.checkpoint.memory import MemorySaver
+
+from report_genius.agent import graph
 from report_genius.agent.graph import _classify_intent
 
 
@@ -18,3 +23,65 @@ def test_classify_intent_analytics() -> None:
 
 def test_classify_intent_general() -> None:
     assert _classify_intent("hello there") == "general"
+
+
+def test_old_tool_results_cleared_when_history_is_large(monkeypatch) -> None:
+    monkeypatch.setattr(graph, "TOOL_RESULT_TRIM_CHARS", 100)
+    monkeypatch.setattr(graph, "TOOL_RESULT_KEEP", 1)
+    history = [HumanMessage("hi")] + [ToolMessage("x" * 60, tool_call_id=str(i)) for i in range(3)]
+
+    sent = graph._clear_old_tool_results(history)
+
+    assert [m.content for m in sent[1:3]] == ["[cleared: 60 chars]"] * 2
+    assert sent[3].content == "x" * 60
+    assert [m.tool_call_id for m in sent[1:]] == ["0", "1", "2"]
+    assert history[1].content == "x" * 60
+    short = history[:2]
+    assert graph._clear_old_tool_results(short) is short
+
+
+class _ScriptedModel(GenericFakeChatModel):
+    def bind_tools(self, tools, **kwargs):
+        return self
+
+
+def test_chat_sync_declines_paused_tool_calls(monkeypatch) -> None:
+    replies = iter([
+        AIMessage(content="", tool_calls=[{"name": "generate_report", "args": {}, "id": "call-1"}]),
+        AIMessage(content="Okay, no report."),
+    ])
+    monkeypatch.setattr(graph, "CONFIRM_TOOLS", frozenset({"generate_report"}))
+    monkeypatch.setattr(graph, "create_llm", lambda: _ScriptedModel(messages=replies))
+    graph._tool_bound_llm.cache_clear()
+    monkeypatch.setattr(graph, "_agent", graph.create_agent(MemorySaver()))
+    try:
+        assert graph.chat_sync("make a report", "sync-confirm") == (
+            "Awaiting confirmation before running: generate_report."
+        )
+        assert graph.chat_sync("never mind", "sync-confirm") == "Okay, no report."
+        history = graph._agent.get_state({"configurable": {"thread_id": "sync-confirm"}}).values["messages"]
+        assert any(isinstance(m, ToolMessage) and m.tool_call_id == "call-1" for m in history)
+    finally:
+        graph._tool_bound_llm.cache_clear()
+
+
+def test_stored_sessions_are_indexed_and_evicted_at_startup(tmp_path, monkeypatch) -> None:
+    from langgraph.checkpoint.base import empty_checkpoint
+
+    monkeypatch.setattr(graph, "CHECKPOINT_DB", str(tmp_path / "checkpoints.db"))
+    monkeypatch.setattr(graph, "_session_last_used", graph.OrderedDict())
+    saver = graph._create_checkpointer()
+    for thread_id in ("old", "mid", "new"):
+        config = {"configurable": {"thread_id": thread_id, "checkpoint_ns": ""}}
+        saver.put(config, empty_checkpoint(), {}, {})
+    saver.conn.close()
+
+    # A restarted process sees the stored threads and evicts past the limit
+    monkeypatch.setattr(graph, "_session_last_used", graph.OrderedDict())
+    monkeypatch.setattr(graph, "MAX_SESSIONS", 2)
+    saver = graph._create_checkpointer()
+
+    assert list(graph._session_last_used) == ["mid", "new"]
+    assert saver.get_tuple({"configurable": {"thread_id": "old"}}) is None
+    assert saver.get_tuple({"configurable": {"thread_id": "new"}}) is not None
+    saver.conn.close()
@@ -0,0 +1,314 @@
+import asyncio
+import os
+import threading
+
+import httpx
+import orjson
+import pytest
+from pydantic import ValidationError
+
+from report_genius.agent import tools
+from report_genius.agent.tools import (
+    _extract_entities,
+    _load_template_cached,
+    _read_template_json,
+    _unknown_entity_error,
+    _write_template_json,
+)
+from report_genius.templates import PortableViewTemplate, create_detail_section
+
+
+def test_extract_entities_prefers_sets() -> None:
+    body = {"count": 3, "entities": [{"Id": 1}], "sets": [{"entities": [{"Id": 2}, {"Id": 3}]}]}
+    entities, count = _extract_entities(body)
+    assert [e["Id"] for e in entities] == [2, 3]
+    assert count == 3
+
+
+def test_extract_entities_falls_back_to_top_level_keys() -> None:
+    assert _extract_entities({"results": [{"Id": 1}]}) == ([{"Id": 1}], 0)
+    assert _extract_entities({"sets": [{"entities": []}], "items": []}) == ([], 0)
+    assert _extract_entities({}) == ([], 0)
+
+
+def test_load_template_cached_reuses_until_file_changes(tmp_path) -> None:
+    json_path = tmp_path / "pv-test.json"
+    _write_template_json(json_path, PortableViewTemplate(id="pv-test", name="One", entity_def="RFI"))
+
+    first = _load_template_cached("pv-test", json_path)
+    assert _load_template_cached("pv-test", json_path) is first
+
+    _write_template_json(json_path, PortableViewTemplate(id="pv-test", name="Two", entity_def="RFI"))
+    stat = json_path.stat()
+    os.utime(json_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000))
+    assert _load_template_cached("pv-test", json_path).name == "Two"
+
+
+def test_unknown_entity_error_accepts_aliases_and_full_defs() -> None:
+    assert _unknown_entity_error("RFI") is None
+    assert _unknown_entity_error("kahua_AEC_RFI.RFI") is None
+    error = _unknown_entity_error("rfiz")
+    assert error["status"] == "error"
+    assert "rfi" in error["available"]
+
+
+def test_kahua_post_retries_transient_status(monkeypatch) -> None:
+    calls = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        if len(calls) == 1:
+            return httpx.Response(503, headers={"Retry-After": "0"})
+        return httpx.Response(200, json={"count": 1})
+
+    monkeypatch.setattr(tools, "_http_client", httpx.Client(transport=httpx.MockTransport(handler)))
+    resp = tools._kahua_post("https://kahua.test/query", {"EntityDef": "x"}, timeout=5.0)
+    assert resp.status_code == 200
+    assert len(calls) == 2
+
+
+def test_read_template_json_matches_validated_load(tmp_path) -> None:
+    template = PortableViewTemplate(
+        name="Demo",
+        entity_def="kahua_AEC_RFI.RFI",
+        sections=[create_detail_section([{"path": "Number", "format": "number"}], title="Info")],
+    )
+    json_path = tmp_path / "pv-demo.json"
+    _write_template_json(json_path, template)
+    loaded = _read_template_json(json_path)
+    assert loaded.model_dump() == PortableViewTemplate.model_validate_json(json_path.read_text()).model_dump()
+
+
+def test_read_template_json_validates_files_it_did_not_write(tmp_path) -> None:
+    json_path = tmp_path / "pv-old.json"
+    json_path.write_bytes(orjson.dumps({"id": "pv-old", "entity_def": "RFI"}))
+    with pytest.raises(ValidationError):
+        _read_template_json(json_path)
+
+
+def test_template_document_has_the_public_shape(tmp_path) -> None:
+    template = PortableViewTemplate(
+        name="Demo",
+        entity_def="kahua_AEC_RFI.RFI",
+        sections=[create_detail_section([{"path": "Number", "format": "number"}], title="Info")],
+    )
+    json_path = tmp_path / "pv-doc.json"
+    _write_template_json(json_path, template)
+    assert tools.template_document(json_path) == orjson.loads(template.model_dump_json())
+
+
+def test_save_template_writes_in_background(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(tools, "TEMPLATES_DIR", tmp_path)
+    template = PortableViewTemplate(id="pv-bg", name="Background", entity_def="kahua_AEC_RFI.RFI")
+    tools._save_template("pv-bg", tmp_path / "pv-bg.json", template)
+    json_path = tools.saved_template_path("pv-bg")
+    assert json_path.exists()
+    template.name = "Changed after save"
+    cached = _load_template_cached("pv-bg", json_path)
+    assert _load_template_cached("pv-bg", json_path) is cached
+    assert cached.name == "Background"
+    assert [p.name for p in tmp_path.iterdir()] == ["pv-bg.json"]
+
+
+def test_saved_template_path_waits_for_every_reader(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(tools, "TEMPLATES_DIR", tmp_path)
+    gate = threading.Event()
+    tools._template_writer.submit(gate.wait)
+    tools._save_template("pv-two", tmp_path / "pv-two.json", PortableViewTemplate(id="pv-two", name="Two", entity_def="x"))
+
+    names = []
+    readers = [
+        threading.Thread(target=lambda: names.append(_read_template_json(tools.saved_template_path("pv-two")).name))
+        for _ in range(2)
+    ]
+    for reader in readers:
+        reader.start()
+    gate.set()
+    for reader in readers:
+        reader.join()
+    assert names == ["Two", "Two"]
+
+
+def test_save_template_coalesces_queued_writes(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(tools, "TEMPLATES_DIR", tmp_path)
+    json_path = tmp_path / "pv-many.json"
+    gate = threading.Event()
+    tools._template_writer.submit(gate.wait)  # hold the writer until both saves are queued
+    for name in ("First", "Second"):
+        tools._save_template("pv-many", json_path, PortableViewTemplate(id="pv-many", name=name, entity_def="x"))
+    gate.set()
+    assert _read_template_json(tools.saved_template_path("pv-many")).name == "Second"
+
+
+def test_failed_modify_leaves_cached_template_untouched(tmp_path, monkeypatch) -> None:
+    monkeypatch.setattr(tools, "TEMPLATES_DIR", tmp_path)
+    json_path = tmp_path / "pv-mod.json"
+    _write_template_json(json_path, PortableViewTemplate(id="pv-mod", name="Original", entity_def="x"))
+    cached = _load_template_cached("pv-mod", json_path)
+
+    def rename_then_fail(template, config) -> None:
+        template.name = "Half-edited"
+        raise ValueError("bad config")
+
+    monkeypatch.setitem(tools._TEMPLATE_OPERATIONS, "rename", rename_then_fail)
+    result = tools.modify_existing_template.invoke({"template_id": "pv-mod", "operation": "rename"})
+
+    assert result["status"] == "error"
+    assert _load_template_cached("pv-mod", json_path) is cached
+    assert cached.name == "Original"
+
+
+def test_kahua_tools_run_sync_and_async(monkeypatch) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"count": 7, "entities": [{"Id": 1}]})
+
+    transport = httpx.MockTransport(handler)
+    monkeypatch.setattr(tools, "_http_client", httpx.Client(transport=transport))
+    monkeypatch.setattr(tools, "_get_async_http_client", lambda: httpx.AsyncClient(transport=transport))
+
+    args = {"entity_def": "rfi"}
+    assert tools.count_entities.invoke(args)["count"] == 7
+    assert asyncio.run(tools.count_entities.ainvoke(args))["count"] == 7
+    assert tools.count_entities.invoke({"entity_def": "rfiz"})["status"] == "error"
+
+
+def test_find_project_filters_server_side_then_reuses_cached_list(monkeypatch) -> None:
+    calls = []
+    projects = [{"Id": 1, "Name": "Harbor Tower"}, {"Id": 2, "Name": "Elm School"}]
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        payload = orjson.loads(request.content)
+        calls.append(payload)
+        if "Condition" in payload:
+            hits = [p for p in projects if payload["Condition"][0]["Value"].lower() in p["Name"].lower()]
+            return httpx.Response(200, json={"entities": hits})
+        return httpx.Response(200, json={"entities": projects})
+
+    monkeypatch.setattr(tools, "_http_client", httpx.Client(transport=httpx.MockTransport(handler)))
+    monkeypatch.setattr(tools, "_kahua_cache", {})
+
+    assert tools.find_project.invoke({"search_term": "harbor"})["matches"][0]["id"] == 1
+    assert len(calls) == 1 and "Condition" in calls[0]
+
+    # A miss falls back to the full list, which later searches then reuse
+    assert tools.find_project.invoke({"search_term": "nowhere"})["status"] == "no_match"
+    assert tools.find_project.invoke({"search_term": "elm"})["matches"][0]["id"] == 2
+    assert len(calls) == 3
+
+
+def test_gather_bounded_caps_concurrency() -> None:
+    running = peak = 0
+
+    async def work(i: int) -> int:
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return i
+
+    results = asyncio.run(tools.gather_bounded([work(i) for i in range(10)], limit=3))
+    assert results == list(range(10))
+    assert peak == 3
+
+
+def test_to_table_states_columns_once() -> None:
+    rows = [{"Id": 1, "Name": "A|B"}, {"Id": 2, "Status": {"Name": "Open"}, "Name": None}]
+    assert tools._to_table(rows) == 'Id|Name|Status\n1|A\\|B|\n2||{"Name":"Open"}'
+
+
+def test_query_entities_projects_rows_and_keeps_full_result(monkeypatch) -> None:
+    entity = {"Id": 5, "Number": "RFI-5", "Subject": "Door", "Question": "long text", "Notes": "more"}
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"count": 1, "entities": [entity]})
+
+    monkeypatch.setattr(tools, "_http_client", httpx.Client(transport=httpx.MockTransport(handler)))
+
+    result = tools.query_entities.invoke({"entity_def": "rfi"})
+    assert result["entities_table"] == "Id|Number|Subject\n5|RFI-5|Door"
+    full = tools.get_full_entity.invoke({"result_id": result["result_id"], "index": 0})
+    assert full["entity"] == entity
+
+
+def test_query_entities_falls_back_to_full_rows_without_projected_keys(monkeypatch) -> None:
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, json={"entities": [{"Code": "A1", "Cost": 5}]})
+
+    monkeypatch.setattr(tools, "_http_client", httpx.Client(transport=httpx.MockTransport(handler)))
+
+    result = tools.query_entities.invoke({"entity_def": "rfi"})
+    assert result["entities_table"] == "Code|Cost\nA1|5"
+
+
+def test_analysis_plan_reuses_parse_for_same_content(monkeypatch) -> None:
+    calls = []
+    monkeypatch.setattr(tools, "analyze_document", lambda doc, ent: calls.append(doc) or object())
+    monkeypatch.setattr(tools, "_analysis_plans", tools.OrderedDict())
+
+    first = tools._analysis_plan(b"doc-a", "RFI")
+    assert tools._analysis_plan(b"doc-a", "RFI") is first
+    tools._analysis_plan(b"doc-b", "RFI")
+    assert calls == [b"doc-a", b"doc-b"]
+
+    # Labels added to the mapping invalidate earlier plans
+    monkeypatch.setitem(tools.LABEL_NORMALIZATIONS, "punch item", "PunchItem.Number")
+    assert tools._analysis_plan(b"doc-a", "RFI") is not first
+
+
+def test_token_mapping_guide_includes_labels_added_at_runtime(monkeypatch) -> None:
+    tools.show_token_mapping_guide.invoke({})
+    monkeypatch.setitem(tools.LABEL_NORMALIZATIONS, "punch item", "PunchItem.Number")
+
+    guide = tools.show_token_mapping_guide.invoke({})
+    assert guide["mappings"]["other_fields"]["punch item"] == "PunchItem.Number"
+
+
+def test_publish_bytes_writes_an_independent_mirror(tmp_path) -> None:
+    uploads, reports = tmp_path / "uploads", tmp_path / "reports"
+    uploads.mkdir()
+    reports.mkdir()
+    (reports / "out.docx").write_bytes(b"stale")
+
+    tools._publish_bytes(b"fresh", uploads / "out.docx", reports / "out.docx")
+
+    assert (uploads / "out.docx").read_bytes() == b"fresh"
+    assert (reports / "out.docx").read_bytes() == b"fresh"
+    assert sorted(p.name for p in tmp_path.rglob("*")) == ["out.docx", "out.docx", "reports", "uploads"]
+
+    # The server rewrites uploads in place; that must not change the published download
+    (uploads / "out.docx").write_bytes(b"edited")
+    assert (reports / "out.docx").read_bytes() == b"fresh"
+
+
+def test_inject_tokens_reuses_identical_run(tmp_path, monkeypatch) -> None:
+    uploads, reports = tmp_path / "uploads", tmp_path / "reports"
+    uploads.mkdir()
+    reports.mkdir()
+    (uploads / "t.docx").write_bytes(b"PK source")
+    monkeypatch.setattr(tools, "UPLOADS_DIR", uploads)
+    monkeypatch.setattr(tools, "REPORTS_DIR", reports)
+    monkeypatch.setattr(tools, "_analysis_plan", lambda doc_bytes, entity_def: None)
+    injections = []
+
+    def fake_analyze_and_inject(doc_bytes, entity_def="", auto_inject=True, plan=None):
+        if not auto_inject:
+            return {"analysis": {"placeholders": []}}
+        injections.append(doc_bytes)
+        return {
+            "modified_document": b"PK tokenized",
+            "injection": {"success": True, "tokens_injected": 1, "changes_made": ["Number"]},
+        }
+
+    monkeypatch.setattr(tools, "analyze_and_inject", fake_analyze_and_inject)
+    args = {"filename": "t.docx", "entity_def": "RFI", "add_logo": False, "add_timestamp": False}
+
+    first = tools.inject_tokens_into_template.invoke(args)
+    second = tools.inject_tokens_into_template.invoke(args)
+    assert first == second
+    assert first["tokens_injected"] == 1
+    assert len(injections) == 1
+
+    (uploads / "t.docx").write_bytes(b"PK edited")
+    tools.inject_tokens_into_template.invoke(args)
+    assert len(injections) == 2